@@ -1,6 +1,27 @@
 import sys
 import datetime
 import os
+import calendar
+import functools
+import time
+import concurrent.futures
+import asyncio
+import io
+import threading
+import bisect
+import heapq
+import math
+import csv
+import json
+import atexit
+import cProfile
+import struct
+import mmap
+import gzip
+import lzma
+import shutil
+import sqlite3
+from array import array
 
 # Custom exceptions for error handling
 class InvalidNameError(Exception):
@@ -23,11 +44,17 @@ class InvalidRateError(Exception):
 
 # Customer class
 class Customer:
+    __slots__ = ('ID', 'name', 'reward', 'lock', 'unsaved')
+
     def __init__(self, ID, name, reward):
         """Initializes a new customer with an ID, name, and reward points."""
         self.ID = ID
         self.name = name
         self.reward = reward
+        # Guards the reward balance and discount rate against concurrent purchases
+        self.lock = threading.RLock()
+        # Set when the customer differs from the saved files
+        self.unsaved = True
 
     def get_id(self):
         """Returns the customer's ID."""
@@ -50,11 +77,18 @@ class Customer:
     def update_reward(self, value):
         pass
     
+    def format_record(self, reward):
+        pass
+
+    def format_info(self):
+        pass
+
     def display_info(self):
         pass
 
 # Basic Customer class, a subtype of customer
 class BasicCustomer(Customer):
+    __slots__ = ()
     reward_rate = 1.0  # Default flat reward rate (100%)
 
     def __init__(self, ID, name, reward=0):
@@ -70,11 +104,21 @@ class BasicCustomer(Customer):
 
     def update_reward(self, value):
         """Updates the reward points for the customer."""
-        self.reward += value
+        with self.lock:
+            self.reward += value
+            self.unsaved = True
     
+    def format_record(self, reward):
+        """Returns the basic customer's line in the customer file with the given reward points."""
+        return f"{self.ID}, {self.name}, {self.reward_rate}, {reward}\n"
+
+    def format_info(self):
+        """Returns the basic customer's information as a listing line."""
+        return f"{self.ID}\t {self.name}\t {self.reward_rate:.0%}\t ---\t {self.reward}".expandtabs(14)
+
     def display_info(self):
         """Displays the basic customer's information."""
-        print(f"{self.ID}\t {self.name}\t {self.reward_rate:.0%}\t ---\t {self.reward}".expandtabs(14))
+        print(self.format_info())
     
     @classmethod
     def set_reward_rate(cls, new_rate):
@@ -83,6 +127,7 @@ class BasicCustomer(Customer):
 
 # VIP Customer class, a subtype of customer
 class VIPCustomer(Customer):
+    __slots__ = ('discount_rate',)
     reward_rate=1.0
 
     def __init__(self, ID, name, reward = 0, discount_rate=0.08):
@@ -107,11 +152,21 @@ class VIPCustomer(Customer):
 
     def update_reward(self, value):
         """Updates the reward points for the VIP customer."""
-        self.reward += value
+        with self.lock:
+            self.reward += value
+            self.unsaved = True
     
+    def format_record(self, reward):
+        """Returns the VIP customer's line in the customer file with the given reward points."""
+        return f"{self.ID}, {self.name}, {self.reward_rate}, {self.discount_rate}, {reward}\n"
+
+    def format_info(self):
+        """Returns the VIP customer's information as a listing line."""
+        return f"{self.ID}\t {self.name}\t {self.reward_rate:.0%}\t {self.discount_rate:.0%}\t {self.reward}".expandtabs(14)
+
     def display_info(self):
         """Displays the VIP customer's information."""
-        print(f"{self.ID}\t {self.name}\t {self.reward_rate:.0%}\t {self.discount_rate:.0%}\t {self.reward}".expandtabs(14))
+        print(self.format_info())
     
     @classmethod
     def set_reward_rate(cls, new_rate):
@@ -120,16 +175,24 @@ class VIPCustomer(Customer):
     
     def set_discount_rate(self, new_rate):
         """Sets a new discount rate for the VIP customer."""
-        self.discount_rate = new_rate
+        with self.lock:
+            self.discount_rate = new_rate
+            self.unsaved = True
         
 # Product class
 class Product:
+    __slots__ = ('ID', 'name', 'price', 'prescription', 'bundles', 'unsaved')
+
     def __init__(self, ID, name, price, prescription):
         """Initializes a new product with an ID, name, and price."""
         self.ID = ID
         self.name = name
         self.price = price
         self.prescription = prescription
+        # Bundles that contain this product, invalidated when it changes
+        self.bundles = []
+        # Set when the product differs from the saved files
+        self.unsaved = True
     
     def get_id(self):
         """Returns the product's ID."""
@@ -147,37 +210,139 @@ class Product:
         """Returns whether the product requires a prescription."""
         return self.prescription
     
+    def get_bundles(self):
+        """Returns the bundles that contain the product."""
+        return self.bundles
+
+    def invalidate_bundles(self):
+        """Marks the cached price and prescription of every containing bundle as stale."""
+        for bundle in self.bundles:
+            bundle.invalidate()
+
     def update_price(self, new_price):
         """Updates the product's price with new price"""
         self.price = new_price
+        self.unsaved = True
+        self.invalidate_bundles()
     
     def update_prescription(self, prescription):
         """Updates the doctor's prescription requirements"""
         self.prescription = prescription
+        self.unsaved = True
+        self.invalidate_bundles()
+
+    def format_record(self):
+        """Returns the product's line in the product file."""
+        return f"{self.ID}, {self.name}, {self.price}, {self.prescription}\n"
+
+    def format_info(self):
+        """Returns the product's information as a listing line."""
+        return f"{self.ID}\t {self.name}\t {self.price:.2f}\t {'YES' if self.prescription == 'y' else 'NO'}\t --".expandtabs(14)
 
     def display_info(self):
         """Displays the product's information."""
-        print(f"{self.ID}\t {self.name}\t {self.price:.2f}\t {'YES' if self.prescription == 'y' else 'NO'}\t --".expandtabs(14))
+        print(self.format_info())
 
 # Bundle class, a subtype of Product
 class Bundle(Product):
+    __slots__ = ('products', 'cached_price', 'cached_prescription', 'dirty')
+
     def __init__(self, ID, name, products):
-        """Initializes a bundle with an ID, name, and a list of component products and call super class."""
+        """Initializes a bundle with an ID, name, and a list of component products whose price and prescription are cached."""
         self.ID = ID
         self.name = name
+        self.bundles = []
         self.products = products
-        self.price = 0.8 * sum(product.get_price() for product in products)
-        self.prescription = any(product.requires_prescription() == 'y' for product in products)
-        super().__init__(ID, name, self.price, 'y' if self.prescription else 'n' )
+        for product in products:
+            product.bundles.append(self)
+        self.dirty = True
+        self.unsaved = True
+
+    @property
+    def price(self):
+        if self.dirty:
+            self.refresh()
+        return self.cached_price
+
+    @property
+    def prescription(self):
+        if self.dirty:
+            self.refresh()
+        return self.cached_prescription
+
+    def refresh(self):
+        """Recomputes the cached price and prescription from the components."""
+        self.cached_price = 0.8 * sum(product.get_price() for product in self.products)
+        self.cached_prescription = 'y' if any(product.requires_prescription() == 'y' for product in self.products) else 'n'
+        self.dirty = False
+
+    def invalidate(self):
+        """Marks the cached values as stale, along with any bundle containing this one."""
+        # A stale bundle's containing bundles are already stale, which stops the walk
+        if not self.dirty:
+            self.dirty = True
+            self.invalidate_bundles()
 
-    def display_info(self):
-        """Displays the bundle's information."""
+    def update_price(self, new_price):
+        """Overrides the bundle's price until one of its components changes"""
+        if self.dirty:
+            self.refresh()
+        self.cached_price = new_price
+        self.invalidate_bundles()
+
+    def update_prescription(self, prescription):
+        """Overrides the bundle's prescription requirement until one of its components changes"""
+        if self.dirty:
+            self.refresh()
+        self.cached_prescription = prescription
+        self.invalidate_bundles()
+
+    def format_record(self):
+        """Returns the bundle's line in the product file."""
+        return f"{self.ID}, {self.name}, {', '.join(product.get_id() for product in self.products)}\n"
+
+    def format_info(self):
+        """Returns the bundle's information as a listing line."""
         component_ids = ', '.join(product.get_id() for product in self.products)
         presc_str = 'YES' if self.prescription == 'y' else 'NO'
-        print(f"{self.ID}\t {self.name}\t {self.price:.2f}\t {presc_str}\t {component_ids}".expandtabs(14))
+        return f"{self.ID}\t {self.name}\t {self.price:.2f}\t {presc_str}\t {component_ids}".expandtabs(14)
+
+# Order timestamps are kept as whole seconds since the epoch and only formatted for output
+EPOCH = datetime.datetime(1970, 1, 1)
+
+def to_epoch(date_time):
+    """Converts an order date time (string, datetime or epoch seconds) to whole seconds since the epoch."""
+    if isinstance(date_time, int):
+        return date_time
+    if isinstance(date_time, datetime.datetime):
+        return calendar.timegm(date_time.timetuple())
+    # Fast path for the fixed width "dd/mm/YYYY HH:MM:SS" layout written by save_orders
+    if len(date_time) == 19:
+        try:
+            return calendar.timegm((int(date_time[6:10]), int(date_time[3:5]), int(date_time[0:2]),
+                                    int(date_time[11:13]), int(date_time[14:16]), int(date_time[17:19])))
+        except ValueError:
+            pass
+    return calendar.timegm(datetime.datetime.strptime(date_time, "%d/%m/%Y %H:%M:%S").timetuple())
+
+@functools.lru_cache(maxsize=4096)
+def from_epoch(seconds):
+    """Converts seconds since the epoch back to an order date time string."""
+    return (EPOCH + datetime.timedelta(seconds=seconds)).strftime("%d/%m/%Y %H:%M:%S")
+
+@functools.lru_cache(maxsize=4096)
+def _readable_minute(minutes):
+    """Returns the display string of an order time given in minutes since the epoch."""
+    return (EPOCH + datetime.timedelta(minutes=minutes)).strftime("%a, %d/%b/%y at %H:%M")
+
+def readable_time(seconds):
+    """Returns the display string of an order time, cached per minute."""
+    return _readable_minute(seconds // 60)
 
 # Order Class
 class Order:
+    __slots__ = ('customer', 'products', 'quantities')
+
     def __init__(self, customer, products, quantities):
         """Initializes a new order with a customer, products, and quantities."""
         self.customer = customer
@@ -202,31 +367,102 @@ class Order:
     
     def apply_reward_points(self, final_cost):
         """Applies reward points to reduce the final cost if the customer has more than 100 points."""
-        if self.customer.reward >= 100:
-            reward_deduction = (self.customer.reward // 100) * 10
-            final_cost -= reward_deduction
-            self.customer.reward %= 100
-            if final_cost < 0:
-                final_cost = 0
+        with self.customer.lock:
+            if self.customer.reward >= 100:
+                reward_deduction = (self.customer.reward // 100) * 10
+                final_cost -= reward_deduction
+                self.customer.reward %= 100
+                if final_cost < 0:
+                    final_cost = 0
         return final_cost
 
+# BatchPricing class
+class BatchPricing:
+    def __init__(self, prices=None, basic_reward_rate=None, vip_reward_rate=None):
+        """Initializes a batch pricer with optional price overrides by product ID and reward rate overrides."""
+        self.prices = prices or {}
+        self.basic_reward_rate = BasicCustomer.reward_rate if basic_reward_rate is None else basic_reward_rate
+        self.vip_reward_rate = VIPCustomer.reward_rate if vip_reward_rate is None else vip_reward_rate
+        self.unit_prices = {}
+
+    def unit_price(self, product):
+        """Returns the unit price of a product under the price overrides."""
+        price = self.unit_prices.get(id(product))
+        if price is None:
+            if product.get_id() in self.prices:
+                price = self.prices[product.get_id()]
+            elif isinstance(product, Bundle) and self.prices:
+                price = 0.8 * sum(self.unit_price(component) for component in product.products)
+            else:
+                price = product.get_price()
+            self.unit_prices[id(product)] = price
+        return price
+
+    def price_orders(self, orders, apply_rewards=True, rewards=None):
+        """Prices many orders in one pass and returns columns of original cost, discount, final cost and reward points."""
+        unit_prices = self.unit_prices
+        unit_price = self.unit_price
+        basic_reward_rate = self.basic_reward_rate
+        vip_reward_rate = self.vip_reward_rate
+        # Redemption depends on each customer's running balance, which is never written back to the customers
+        balances = dict(rewards) if rewards is not None else {}
+        original_costs = array('d')
+        discounts = array('d')
+        final_costs = array('d')
+        reward_points = array('q')
+        for order in orders:
+            customer = order.customer
+            cost = sum([(unit_prices.get(id(product)) or unit_price(product)) * quantity
+                        for product, quantity in zip(order.products, order.quantities)])
+            if isinstance(customer, VIPCustomer):
+                discount = cost * customer.discount_rate
+                final_cost = cost - discount
+                points = round(final_cost * vip_reward_rate)
+            else:
+                discount = 0.0
+                final_cost = cost
+                points = round(final_cost * basic_reward_rate)
+            if apply_rewards:
+                customer_id = customer.get_id()
+                balance = balances.get(customer_id)
+                if balance is None:
+                    balance = customer.get_current_reward()
+                if balance >= 100:
+                    final_cost = max(final_cost - (balance // 100) * 10, 0)
+                    balance %= 100
+                balances[customer_id] = balance + points
+            original_costs.append(cost)
+            discounts.append(discount)
+            final_costs.append(final_cost)
+            reward_points.append(points)
+        return original_costs, discounts, final_costs, reward_points
+
 # OrderHistory class, a subtype of Order
 class OrderHistory(Order):
+    __slots__ = ('total_cost', 'earned_rewards', 'timestamp')
+
     def __init__(self, customer, products, quantities, total_cost, earned_rewards, date_time):
         """Initializes a new order history with a customer, products, quantities, total cost, earned rewards and date."""
         super().__init__(customer, products, quantities)
         self.total_cost = total_cost
         self.earned_rewards = earned_rewards
-        self.date_time = datetime.datetime.strftime(date_time, "%d/%m/%Y %H:%M:%S") if isinstance(date_time, datetime.datetime) else date_time
+        self.timestamp = to_epoch(date_time)
 
-    def display_info(self):
-        """Displays the order history information."""
+    @property
+    def date_time(self):
+        return from_epoch(self.timestamp)
+
+    def format_info(self):
+        """Returns the order history information as a listing line."""
         products_str = ', '.join(f'{quantity} x {product.get_id()}' for product, quantity in zip(self.products,self.quantities))
 
-        dt = datetime.datetime.strptime(self.date_time, "%d/%m/%Y %H:%M:%S")
-        readable_string = dt.strftime("%a, %d/%b/%y at %H:%M")
+        readable_string = readable_time(self.timestamp)
 
-        print(f"{self.customer.get_name():<7} {products_str:<23} {self.total_cost}\t {self.earned_rewards}\t {readable_string}".expandtabs(8))
+        return f"{self.customer.get_name():<7} {products_str:<23} {self.total_cost}\t {self.earned_rewards}\t {readable_string}".expandtabs(8)
+
+    def display_info(self):
+        """Displays the order history information."""
+        print(self.format_info())
 
     def get_customer_id(self):
         """Returns the customer's id"""
@@ -243,122 +479,1171 @@ class OrderHistory(Order):
     def get_date_time(self):
         """Returns the date time of order"""
         return self.date_time
+
+    def get_timestamp(self):
+        """Returns the date time of order in seconds since the epoch"""
+        return self.timestamp
     
+# OrderHistoryView class, a read-only OrderHistory backed by a row of an OrderStore
+class OrderHistoryView(OrderHistory):
+    __slots__ = ('store', 'row')
+
+    def __init__(self, store, row):
+        """Initializes a view over one row of a columnar order store."""
+        self.store = store
+        self.row = row
+
+    @property
+    def customer(self):
+        return self.store.customers[self.store.customer_index[self.row]]
+
+    @property
+    def products(self):
+        start, end = self.store.line_range(self.row)
+        return [self.store.products[index] for index in self.store.line_products[start:end]]
+
+    @property
+    def quantities(self):
+        start, end = self.store.line_range(self.row)
+        return self.store.line_quantities[start:end].tolist()
+
+    @property
+    def total_cost(self):
+        return self.store.total_cost[self.row]
+
+    @property
+    def earned_rewards(self):
+        return self.store.earned_rewards[self.row]
+
+    @property
+    def timestamp(self):
+        return self.store.timestamp[self.row]
+
+# OrderStore class
+class OrderStore:
+    def __init__(self, customers, products):
+        """Initializes empty typed columns holding order history rows."""
+        self.customers = customers
+        self.products = products
+        self.customer_index = array('i')
+        self.total_cost = array('d')
+        self.earned_rewards = array('i')
+        self.timestamp = array('q')
+        self.line_start = array('q', [0])
+        self.line_products = array('i')
+        self.line_quantities = array('i')
+
+    def __len__(self):
+        """Returns the number of stored orders."""
+        return len(self.customer_index)
+
+    def append(self, customer_position, product_positions, quantities, total_cost, earned_rewards, timestamp):
+        """Appends an order row and returns its row number."""
+        self.customer_index.append(customer_position)
+        self.total_cost.append(total_cost)
+        self.earned_rewards.append(earned_rewards)
+        self.timestamp.append(timestamp)
+        self.line_products.extend(product_positions)
+        self.line_quantities.extend(quantities)
+        self.line_start.append(len(self.line_products))
+        return len(self.customer_index) - 1
+
+    def line_range(self, row):
+        """Returns the start and end offsets of a row's line items."""
+        return self.line_start[row], self.line_start[row + 1]
+
+    def view(self, row):
+        """Returns an order history view over a row."""
+        return OrderHistoryView(self, row)
+
+    def clear(self):
+        """Removes every stored row."""
+        self.__init__(self.customers, self.products)
+
+def parse_customer_line(line):
+    """Returns the parsed row of a customer file line, or None for a blank line."""
+    data = line.strip().split(', ')
+    if data == ['']:
+        return None
+    if len(data) == 5:
+        customer_id, name, reward_rate, discount_rate, reward = data
+        return ('V', customer_id, name, float(discount_rate), int(reward))
+    customer_id, name, reward_rate, reward = data
+    return ('B', customer_id, name, float(reward_rate), int(reward))
+
+def parse_product_line(line):
+    """Returns the parsed row of a product file line, or None for a blank line."""
+    data = line.strip().split(', ')
+    if data == ['']:
+        return None
+    if data[0].startswith('B'):
+        return ('B', data[0], data[1], data[2:])
+    product_id, name, price, prescription = data
+    return ('P', product_id, name, float(price), prescription)
+
+def parse_order_line(line):
+    """Returns the parsed row of an order file line, or None for a blank line."""
+    data = line.strip().split(', ')
+    if len(data) < 4:
+        return None
+    # (customer ID or name, product IDs or names, quantities, total cost, earned rewards, date time)
+    return (data[0], data[1:-3:2], [int(quantity) for quantity in data[2:-3:2]],
+            float(data[-3]), int(data[-2]), data[-1])
+
+def write_atomically(filename, lines):
+    """Writes lines to a temporary file and renames it over filename, so readers never see a partial file."""
+    temp_filename = filename + '.tmp'
+    with open(temp_filename, 'w') as file:
+        file.writelines(lines)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_filename, filename)
+
+def read_changes(filename, parser):
+    """Returns the parsed rows and the lines of a changes file keyed by ID, both empty if there is no file."""
+    rows = {}
+    lines = {}
+    try:
+        with open(filename, 'r') as file:
+            for line in file:
+                row = parser(line)
+                if row:
+                    rows[row[1]] = row
+                    lines[row[1]] = line
+    except FileNotFoundError:
+        pass
+    return rows, lines
+
+def merge_changes(rows, changed_rows):
+    """Replaces the first row with each changed ID by its changed row and appends the rows of new IDs."""
+    if not changed_rows:
+        return rows
+    pending = dict(changed_rows)
+    merged = [pending.pop(row[1], row) for row in rows]
+    return merged + list(pending.values())
+
+# Binary snapshot layout: header, customers, products, then the order columns as raw arrays
+SNAPSHOT_MAGIC = b'PHSNAP'
+SNAPSHOT_VERSION = 1
+SNAPSHOT_HEADER = struct.Struct('<6sHBd')
+SNAPSHOT_COUNT = struct.Struct('<q')
+SNAPSHOT_CUSTOMER = struct.Struct('<Bdq')
+SNAPSHOT_PRODUCT = struct.Struct('<Bd1si')
+
+def _pack_string(value):
+    """Returns a length-prefixed UTF-8 encoding of a string."""
+    data = value.encode('utf-8')
+    return struct.pack('<I', len(data)) + data
+
+def _unpack_string(buffer, offset):
+    """Returns a length-prefixed UTF-8 string and the offset after it."""
+    length, = struct.unpack_from('<I', buffer, offset)
+    offset += 4
+    return bytes(buffer[offset:offset + length]).decode('utf-8'), offset + length
+
+def _unpack_array(typecode, buffer, offset, count, swap):
+    """Returns a typed array read from the buffer and the offset after it."""
+    values = array(typecode)
+    end = offset + count * values.itemsize
+    values.frombytes(buffer[offset:end])
+    if swap:
+        values.byteswap()
+    return values, end
+
+def line_ranges(filename, count):
+    """Splits a file into at most count byte ranges that start and end on line boundaries."""
+    size = os.path.getsize(filename)
+    boundaries = [0]
+    with open(filename, 'rb') as file:
+        for i in range(1, count):
+            file.seek(size * i // count)
+            file.readline()
+            boundary = min(file.tell(), size)
+            if boundary > boundaries[-1]:
+                boundaries.append(boundary)
+    if size > boundaries[-1]:
+        boundaries.append(size)
+    return list(zip(boundaries, boundaries[1:]))
+
+def parse_file_range(parser, filename, start, end):
+    """Parses the lines of one byte range of a file, skipping blank lines."""
+    with open(filename, 'rb') as file:
+        file.seek(start)
+        data = file.read(end - start).decode()
+    return [row for row in map(parser, data.splitlines()) if row]
+
+def parse_order_range(filename, start, end):
+    """Parses one byte range of an order file into compact columns for cheap transfer between processes."""
+    customer_fields = []
+    product_fields = []
+    line_counts = array('i')
+    quantities = array('i')
+    total_costs = array('d')
+    earned_rewards = array('i')
+    timestamps = array('q')
+    for row in parse_file_range(parse_order_line, filename, start, end):
+        customer_fields.append(row[0])
+        product_fields.extend(row[1])
+        line_counts.append(len(row[1]))
+        quantities.extend(row[2])
+        total_costs.append(row[3])
+        earned_rewards.append(row[4])
+        timestamps.append(to_epoch(row[5]))
+    return customer_fields, product_fields, line_counts, quantities, total_costs, earned_rewards, timestamps
+
+# Line offset index layout: header, line offsets, then per-customer rows and totals
+ARCHIVE_INDEX_MAGIC = b'PHIDX'
+ARCHIVE_INDEX_VERSION = 1
+ARCHIVE_INDEX_HEADER = struct.Struct('<5sHqqq')
+ARCHIVE_INDEX_GROUP = struct.Struct('<qdq')
+
+# OrderArchive class
+class OrderArchive:
+    def __init__(self, filename):
+        """Memory-maps a read-only order file and loads or rebuilds its line offset index."""
+        self.filename = filename
+        self.index_file = filename + '.idx'
+        self.file = open(filename, 'rb')
+        stat = os.fstat(self.file.fileno())
+        self.size = stat.st_size
+        self.mtime = stat.st_mtime_ns
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b''
+        # Customer field of the order file -> (row numbers, total spend, total rewards)
+        self.groups = {}
+        if not self.read_index():
+            self.build_index()
+            self.write_index()
+
+    def __len__(self):
+        """Returns the number of orders in the archive."""
+        return len(self.offsets) - 1
+
+    def build_index(self):
+        """Scans the mapped order file once for line starts and per-customer totals."""
+        self.offsets = array('q', [0])
+        self.groups = {}
+        start = 0
+        while start < self.size:
+            end = self.map.find(b'\n', start)
+            end = self.size if end == -1 else end + 1
+            row = parse_order_line(self.map[start:end].decode())
+            if row:
+                self.offsets.append(end)
+                rows, spend, rewards = self.groups.get(row[0], (None, 0.0, 0))
+                if rows is None:
+                    rows = array('q')
+                rows.append(len(self.offsets) - 2)
+                self.groups[row[0]] = (rows, spend + row[3], rewards + row[4])
+            else:
+                # Blank lines are folded into the previous row's span
+                self.offsets[-1] = end
+            start = end
+
+    def read_index(self):
+        """Loads the persisted index and returns whether it matches the order file."""
+        try:
+            with open(self.index_file, 'rb') as file:
+                buffer = memoryview(file.read())
+        except OSError:
+            return False
+        if len(buffer) < ARCHIVE_INDEX_HEADER.size:
+            return False
+        magic, version, size, mtime, count = ARCHIVE_INDEX_HEADER.unpack_from(buffer, 0)
+        if magic != ARCHIVE_INDEX_MAGIC or version != ARCHIVE_INDEX_VERSION or size != self.size or mtime != self.mtime:
+            return False
+        offset = ARCHIVE_INDEX_HEADER.size
+        self.offsets, offset = _unpack_array('q', buffer, offset, count + 1, sys.byteorder != 'little')
+        group_count, = SNAPSHOT_COUNT.unpack_from(buffer, offset)
+        offset += SNAPSHOT_COUNT.size
+        for _ in range(group_count):
+            field, offset = _unpack_string(buffer, offset)
+            row_count, spend, rewards = ARCHIVE_INDEX_GROUP.unpack_from(buffer, offset)
+            offset += ARCHIVE_INDEX_GROUP.size
+            rows, offset = _unpack_array('q', buffer, offset, row_count, sys.byteorder != 'little')
+            self.groups[field] = (rows, spend, rewards)
+        return True
+
+    def write_index(self):
+        """Persists the index next to the order file, if the directory is writable."""
+        offsets = array('q', self.offsets)
+        if sys.byteorder != 'little':
+            offsets.byteswap()
+        chunks = [ARCHIVE_INDEX_HEADER.pack(ARCHIVE_INDEX_MAGIC, ARCHIVE_INDEX_VERSION, self.size, self.mtime, len(self)),
+                  offsets.tobytes(), SNAPSHOT_COUNT.pack(len(self.groups))]
+        for field, (rows, spend, rewards) in self.groups.items():
+            rows = array('q', rows)
+            if sys.byteorder != 'little':
+                rows.byteswap()
+            chunks.append(_pack_string(field) + ARCHIVE_INDEX_GROUP.pack(len(rows), spend, rewards) + rows.tobytes())
+        try:
+            temp_filename = self.index_file + '.tmp'
+            with open(temp_filename, 'wb') as file:
+                file.writelines(chunks)
+            os.replace(temp_filename, self.index_file)
+        except OSError:
+            pass
+
+    def row(self, number):
+        """Decodes and returns the parsed row of one order."""
+        return parse_order_line(self.map[self.offsets[number]:self.offsets[number + 1]].decode())
+
+    def iter_rows(self, numbers=None):
+        """Yields parsed rows lazily, for every order or for the given row numbers."""
+        for number in range(len(self)) if numbers is None else numbers:
+            yield self.row(number)
+
+    def close(self):
+        """Unmaps and closes the order file."""
+        if self.size:
+            self.map.close()
+        self.file.close()
+
+# OrderPartitions class, older orders moved into per-month or per-day files listed in a manifest
+class OrderPartitions:
+    OPENERS = {'.gz': gzip.open, '.xz': lzma.open}
+    SUFFIXES = {'gzip': '.gz', 'lzma': '.xz'}
+    # Most partition files kept open at once while orders are moved in
+    MAX_OPEN_FILES = 64
+
+    def __init__(self, order_file):
+        """Initializes the partitions of an order file from their manifest, if there is one."""
+        self.directory = order_file + '.partitions'
+        self.manifest_file = os.path.join(self.directory, 'manifest.json')
+        self.granularity = 'month'
+        self.partitions = {}
+        if os.path.isfile(self.manifest_file):
+            with open(self.manifest_file, 'r') as file:
+                manifest = json.load(file)
+            self.granularity = manifest['granularity']
+            self.partitions = manifest['partitions']
+        self.customers = {key: set(partition['customers']) for key, partition in self.partitions.items()}
+
+    @staticmethod
+    def exists(order_file):
+        """Returns whether an order file has partitions."""
+        return os.path.isfile(os.path.join(order_file + '.partitions', 'manifest.json'))
+
+    def partition_key(self, date_time):
+        """Returns the partition of a dd/mm/YYYY date time, as YYYY-MM or YYYY-MM-DD."""
+        if self.granularity == 'day':
+            return f"{date_time[6:10]}-{date_time[3:5]}-{date_time[0:2]}"
+        return f"{date_time[6:10]}-{date_time[3:5]}"
+
+    def open_partition(self, key, mode='rt'):
+        """Opens a partition file, decompressing it if needed."""
+        filename = os.path.join(self.directory, self.partitions[key]['file'])
+        return self.OPENERS.get(os.path.splitext(filename)[1], open)(filename, mode)
+
+    def manifest(self):
+        """Returns the manifest contents."""
+        for key, customers in self.customers.items():
+            self.partitions[key]['customers'] = sorted(customers)
+        return {'granularity': self.granularity, 'partitions': self.partitions}
+
+    def save_manifest(self):
+        """Writes the manifest atomically."""
+        write_atomically(self.manifest_file, [json.dumps(self.manifest(), indent=1)])
+
+    @staticmethod
+    def recover(order_file):
+        """Undoes a move into the partitions interrupted before the order file was emptied, so no order is partitioned twice."""
+        directory = order_file + '.partitions'
+        manifest_file = os.path.join(directory, 'manifest.json')
+        marker = manifest_file + '.moving'
+        if not os.path.isfile(marker):
+            return
+        with open(marker, 'r') as file:
+            moving = json.load(file)
+        # An order file that was not emptied yet still holds every order being moved
+        if moving['order_file'] and os.path.isfile(order_file) and os.path.getsize(order_file) >= moving['order_file']:
+            if moving['manifest'] is None:
+                # There were no partitions before the move
+                shutil.rmtree(directory)
+                return
+            for name in os.listdir(directory):
+                path = os.path.join(directory, name)
+                if name in moving['sizes']:
+                    with open(path, 'r+b') as file:
+                        file.truncate(moving['sizes'][name])
+                elif name not in ('manifest.json', 'manifest.json.moving'):
+                    os.remove(path)
+            write_atomically(manifest_file, [json.dumps(moving['manifest'], indent=1)])
+        os.remove(marker)
+
+    def add_orders(self, filename, granularity=None):
+        """Moves the orders of an order file into their partitions, empties the order file and returns how many there were."""
+        manifest = self.manifest() if os.path.isfile(self.manifest_file) else None
+        if granularity and not self.partitions:
+            self.granularity = granularity
+        os.makedirs(self.directory, exist_ok=True)
+        # The marker records the manifest and the file sizes before the move, in case it is interrupted
+        sizes = {partition['file']: os.path.getsize(os.path.join(self.directory, partition['file'])) for partition in self.partitions.values()}
+        write_atomically(self.manifest_file + '.moving', [json.dumps({'order_file': os.path.getsize(filename), 'sizes': sizes, 'manifest': manifest})])
+        files = {}
+        count = 0
+        try:
+            with open(filename, 'r') as source:
+                for line in source:
+                    row = parse_order_line(line)
+                    if not row:
+                        continue
+                    timestamp = to_epoch(row[5])
+                    key = self.partition_key(from_epoch(timestamp))
+                    partition = self.partitions.get(key)
+                    if partition is None:
+                        partition = self.partitions[key] = {'file': key + '.txt', 'min': timestamp, 'max': timestamp, 'orders': 0, 'customers': []}
+                        self.customers[key] = set()
+                    file = files.get(key)
+                    if file is None:
+                        if len(files) >= self.MAX_OPEN_FILES:
+                            for open_file in files.values():
+                                open_file.close()
+                            files.clear()
+                        file = files[key] = self.open_partition(key, 'at')
+                    file.write(line if line.endswith('\n') else line + '\n')
+                    partition['min'] = min(partition['min'], timestamp)
+                    partition['max'] = max(partition['max'], timestamp)
+                    partition['orders'] += 1
+                    self.customers[key].add(row[0])
+                    count += 1
+        finally:
+            for file in files.values():
+                file.close()
+        self.save_manifest()
+        write_atomically(filename, [])
+        os.remove(self.manifest_file + '.moving')
+        return count
+
+    def compress(self, method='gzip', keep=1):
+        """Compresses every uncompressed partition but the keep newest and returns how many were compressed."""
+        suffix = self.SUFFIXES[method]
+        keys = sorted(self.partitions)
+        compressed = 0
+        for key in keys[:len(keys) - keep]:
+            partition = self.partitions[key]
+            if partition['file'] != key + '.txt':
+                continue
+            source = os.path.join(self.directory, partition['file'])
+            with open(source, 'rb') as file, self.OPENERS[suffix](source + suffix, 'wb') as target:
+                shutil.copyfileobj(file, target)
+            partition['file'] = key + '.txt' + suffix
+            # The plain file is only removed once the manifest points at the compressed one
+            self.save_manifest()
+            os.remove(source)
+            compressed += 1
+        return compressed
+
+    def select(self, start=None, end=None, customer_keys=None):
+        """Returns the partitions, oldest first, that can hold orders between start and end (epoch seconds) by one of the customer keys."""
+        return [key for key in sorted(self.partitions)
+                if (start is None or self.partitions[key]['max'] >= start)
+                and (end is None or self.partitions[key]['min'] <= end)
+                and (not customer_keys or any(customer_key in self.customers[key] for customer_key in customer_keys))]
+
+    def iter_lines(self, start=None, end=None, customer_keys=None):
+        """Yields the order lines of the selected partitions."""
+        for key in self.select(start, end, customer_keys):
+            with self.open_partition(key) as file:
+                yield from file
+
+    def remove(self):
+        """Deletes the partitions and their manifest."""
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+# CustomerSummary class
+class CustomerSummary:
+    def __init__(self):
+        """Initializes running order totals for a customer."""
+        self.total_spend = 0.0
+        self.total_rewards = 0
+        self.order_count = 0
+
+    def add_order(self, order):
+        """Adds an order history entry to the running totals."""
+        self.record(order.get_total_cost(), order.get_earned_rewards())
+
+    def record(self, total_cost, earned_rewards, order_count=1):
+        """Adds the total cost and earned rewards of one or more orders to the running totals."""
+        self.total_spend += total_cost
+        self.total_rewards += earned_rewards
+        self.order_count += order_count
+
+    def get_total_spend(self):
+        """Returns the total amount spent by the customer."""
+        return self.total_spend
+
+    def get_total_rewards(self):
+        """Returns the total reward points earned by the customer."""
+        return self.total_rewards
+
+    def get_order_count(self):
+        """Returns the number of orders placed by the customer."""
+        return self.order_count
+
+# RankedTotals class
+class RankedTotals:
+    def __init__(self):
+        """Initializes running totals per key, ranked only when a top-N query asks for it."""
+        self.totals = {}
+
+    def add(self, key, amount):
+        """Adds an amount to a key's total."""
+        self.totals[key] = self.totals.get(key, 0) + amount
+
+    def get(self, key):
+        """Returns a key's total."""
+        return self.totals.get(key, 0)
+
+    def top(self, count):
+        """Returns the count highest (key, total) pairs, highest first."""
+        return heapq.nlargest(count, self.totals.items(), key=lambda item: (item[1], item[0])) if count > 0 else []
+
+# SalesAnalytics class
+class SalesAnalytics:
+    def __init__(self):
+        """Initializes sales aggregates that are built on first use and then updated as each order is placed."""
+        self.product_revenue = RankedTotals()
+        self.product_units = RankedTotals()
+        self.customer_spend = RankedTotals()
+        # Revenue and order counts per day, keyed by days since the epoch
+        self.daily_totals = {}
+
+    def record(self, customer_id, products, quantities, total_cost, timestamp):
+        """Adds one order to the aggregates, sharing its total cost between its lines in proportion to their list value."""
+        line_values = [product.get_price() * quantity for product, quantity in zip(products, quantities)]
+        list_value = sum(line_values)
+        for product, quantity, line_value in zip(products, quantities, line_values):
+            revenue = total_cost * line_value / list_value if list_value else total_cost / len(products)
+            product_id = product.get_id()
+            self.product_revenue.add(product_id, revenue)
+            self.product_units.add(product_id, quantity)
+        self.customer_spend.add(customer_id, total_cost)
+        day = timestamp // 86400
+        revenue, orders = self.daily_totals.get(day, (0.0, 0))
+        self.daily_totals[day] = (revenue + total_cost, orders + 1)
+
+    def top_products(self, count):
+        """Returns the count products with the highest revenue."""
+        return self.product_revenue.top(count)
+
+    def top_customers(self, count):
+        """Returns the count customers with the highest spend."""
+        return self.customer_spend.top(count)
+
+# NameIndex class, prefix and typo-tolerant name search over a sorted list and trigram postings
+class NameIndex:
+    # Lowest trigram similarity (shared / all distinct trigrams) of a fuzzy match
+    SIMILARITY = 0.3
+    # Most names scored for one fuzzy search, taken from the rarest trigrams first
+    MAX_CANDIDATES = 1000
+
+    def __init__(self):
+        """Initializes an empty index."""
+        self.entries = [] # sorted (lowercase name, position) pairs
+        self.pending = [] # pairs added since the entries were last sorted
+        self.names = {}
+        self.grams = {}
+        # The entries and trigrams are built by the first search, so loading only records the names
+        self.built = False
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def name_grams(name):
+        """Returns the set of trigrams of a name padded with $ at both ends."""
+        padded = f"$${name}$"
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+    def add(self, name, position):
+        """Indexes the name of the item at a list position."""
+        key = name.lower()
+        with self.lock:
+            self.names[position] = key
+            if self.built:
+                self.pending.append((key, position))
+                self._add_grams(key, position)
+
+    def _add_grams(self, key, position):
+        """Adds a position to the postings of each trigram of a lowercase name."""
+        for gram in self.name_grams(key):
+            self.grams.setdefault(gram, array('i')).append(position)
+
+    def _build(self):
+        """Sorts the names recorded so far and builds their trigram postings."""
+        self.entries = sorted((key, position) for position, key in self.names.items())
+        self.pending.clear()
+        for position, key in self.names.items():
+            self._add_grams(key, position)
+        self.built = True
+
+    def _merge_pending(self):
+        """Moves the names added since the last search into the sorted entries."""
+        if len(self.pending) < 32:
+            for entry in self.pending:
+                bisect.insort(self.entries, entry)
+        else:
+            self.entries.extend(self.pending)
+            self.entries.sort()
+        self.pending.clear()
+
+    def search(self, text, limit=10):
+        """Returns up to limit positions ranked as exact name matches, then prefix matches, then the most similar names."""
+        key = text.strip().lower()
+        if not key or limit <= 0:
+            return []
+        with self.lock:
+            if not self.built:
+                self._build()
+            elif self.pending:
+                self._merge_pending()
+            results = []
+            entries = self.entries
+            index = bisect.bisect_left(entries, (key,))
+            while index < len(entries) and len(results) < limit and entries[index][0].startswith(key):
+                results.append(entries[index][1])
+                index += 1
+            if len(results) == limit:
+                return results
+
+            # A name similar enough shares at least needed trigrams with the query, so it
+            # must contain one of the len(query) - needed + 1 rarest query trigrams
+            query = self.name_grams(key)
+            needed = math.ceil(self.SIMILARITY * len(query))
+            postings = sorted((self.grams.get(gram, ()) for gram in query), key=len)[:len(query) - needed + 1]
+            candidates = set()
+            for positions in postings:
+                candidates.update(positions[:self.MAX_CANDIDATES - len(candidates)])
+                if len(candidates) >= self.MAX_CANDIDATES:
+                    break
+            candidates.difference_update(results)
+            scored = []
+            for position in candidates:
+                name = self.names[position]
+                grams = self.name_grams(name)
+                shared = len(query & grams)
+                similarity = shared / (len(query) + len(grams) - shared)
+                if similarity >= self.SIMILARITY:
+                    scored.append((-similarity, name, position))
+        results.extend(position for _, _, position in heapq.nsmallest(limit - len(results), scored))
+        return results
+
 # Records class
 class Records:
-    def __init__(self):
+    def __init__(self, compact_orders=False):
         """Initializes the Records class with empty customer, product lists and order history."""
         self.customers = []
         self.products = []
         self.order_history =[]
+        # In compact mode order history lives in typed columns rather than OrderHistory objects
+        self.order_store = OrderStore(self.customers, self.products) if compact_orders else None
+        self.customer_rows = {}
+        # Separate locks for the customer list, the product list and the order history
+        self.customers_lock = threading.RLock()
+        self.products_lock = threading.RLock()
+        self.orders_lock = threading.RLock()
+        self.last_customer_number = 0
+        # Loaders add each order's earned rewards to the saved balances unless a reward ledger holds the balances
+        self.replay_rewards = True
+        # Highest number of any product or bundle ID, so new IDs are never reused
+        self.last_product_number = 0
+        # (line number, line) of bundles that could not be loaded, so saving keeps them in the product file
+        self.unresolved_products = []
+        # Hash indexes mapping IDs and names to positions in the lists above
+        self.customer_ids = {}
+        self.customer_names = {}
+        self.product_ids = {}
+        self.product_names = {}
+        # Prefix and fuzzy name search
+        self.customer_search = NameIndex()
+        self.product_search = NameIndex()
+        # Lines written to the changes files since the last full save, keyed by ID
+        self.changed_customers = {}
+        self.changed_products = {}
+        # Held while a customer or product file or its changes file is written, as writers share their temporary files
+        self.save_lock = threading.RLock()
+        # IDs of customers created by purchases that are in neither the customer file nor its changes file yet
+        self.new_customers = set()
+        self.saved_reward_rates = (BasicCustomer.reward_rate, VIPCustomer.reward_rate)
+        # Order history entries and running totals keyed by customer ID
+        self.customer_orders = {}
+        self.customer_summaries = {}
+        # Sales aggregates are built from the order history the first time they are needed
+        self.analytics = SalesAnalytics()
+        self.analytics_complete = False
+        # Order file whose rows are streamed instead of held in order_history
+        self.order_file = None
+        # Memory-mapped order file used by read-only terminals
+        self.order_archive = None
+        self.archive_rows = {}
+        # SQLite storage whose orders are queried instead of held in memory
+        self.order_database = None
+
+    def _index_item(self, id_index, name_index, search_index, item, position):
+        """Registers an item's ID and name in the given indexes."""
+        # The first item with a given ID keeps it, matching the old linear scan
+        id_index.setdefault(item.get_id(), position)
+        # Items sharing a name are all kept, in list order
+        name_index.setdefault(item.get_name(), []).append(position)
+        search_index.add(item.get_name(), position)
+
+    def _find_indexed(self, items, id_index, name_index, search_value):
+        """Returns the first item in list order whose ID or name matches the search value."""
+        id_position = id_index.get(search_value)
+        name_positions = name_index.get(search_value)
+        name_position = name_positions[0] if name_positions else None
+        if id_position is None and name_position is None:
+            return None
+        if id_position is None:
+            return items[name_position]
+        if name_position is None:
+            return items[id_position]
+        return items[min(id_position, name_position)]
+
+    def add_customer(self, customer):
+        """Adds a customer to the customer list and indexes."""
+        with self.customers_lock:
+            self.customers.append(customer)
+            self._index_item(self.customer_ids, self.customer_names, self.customer_search, customer, len(self.customers) - 1)
+
+    def create_customer(self, name):
+        """Returns the customer with the given name, creating a basic customer with the next free ID if there is none."""
+        with self.customers_lock:
+            # Another terminal may have created the customer since it was looked up
+            customer = self.find_customer(name)
+            if not customer:
+                self.last_customer_number = max(self.last_customer_number, self.highest_id_number()) + 1
+                customer = BasicCustomer(f"B{self.last_customer_number}", name)
+                self.add_customer(customer)
+                self.new_customers.add(customer.get_id())
+            return customer
+
+    def add_product(self, product):
+        """Adds a product or bundle to the product list and indexes."""
+        with self.products_lock:
+            self.products.append(product)
+            self._index_item(self.product_ids, self.product_names, self.product_search, product, len(self.products) - 1)
+            number = product.get_id()[1:]
+            if number.isdigit():
+                self.last_product_number = max(self.last_product_number, int(number))
+
+    def allocate_product_id(self):
+        """Returns a new product ID numbered after every product and bundle ID seen so far."""
+        with self.products_lock:
+            self.last_product_number += 1
+            return f"P{self.last_product_number}"
+
+    def add_order(self, order):
+        """Adds an order history entry to the order history and the per-customer indexes."""
+        customer_id = order.get_customer_id()
+        with self.orders_lock:
+            # Orders of a database are stored by its append_order and queried from it, not kept here
+            if self.order_database is None:
+                if self.order_store is not None:
+                    row = self.order_store.append(self._position_of(order.customer, self.customers, self.customer_ids),
+                                                  [self._position_of(product, self.products, self.product_ids) for product in order.products],
+                                                  order.quantities, order.get_total_cost(), order.get_earned_rewards(),
+                                                  order.get_timestamp())
+                    self.customer_rows.setdefault(customer_id, array('i')).append(row)
+                else:
+                    self.order_history.append(order)
+                    self.customer_orders.setdefault(customer_id, []).append(order)
+            self._summary_for(customer_id).add_order(order)
+            # Incomplete aggregates are rebuilt from the order history later, which will include this order
+            if self.analytics_complete:
+                self.analytics.record(customer_id, order.products, order.quantities, order.get_total_cost(), order.get_timestamp())
+
+    def _position_of(self, item, items, id_index):
+        """Returns the list position of a customer or product."""
+        position = id_index.get(item.get_id())
+        if position is not None and items[position] is item:
+            return position
+        return items.index(item)
+
+    def _summary_for(self, customer_id):
+        """Returns the running totals of a customer ID, creating them on first use."""
+        summary = self.customer_summaries.get(customer_id)
+        if summary is None:
+            summary = self.customer_summaries[customer_id] = CustomerSummary()
+        return summary
     
     def read_customers(self, filename):
         """Reads customer data from a file and stores them in the customer list."""
         try:
             with open(filename, 'r') as file:
-                for line in file:
-                    data = line.strip().split(', ')
-                    if len(data) == 5:
-                        customer_id, name, reward_rate, discount_rate, reward = data
-                        customer = VIPCustomer(customer_id, name, int(reward), float(discount_rate))
-                        self.customers.append(customer)
-                    else:
-                        customer_id, name, reward_rate, reward = data
-                        customer = BasicCustomer(customer_id, name, int(reward))
-                        BasicCustomer.reward_rate = float(reward_rate)
-                        self.customers.append(customer)
+                rows = [row for row in map(parse_customer_line, file) if row]
         except FileNotFoundError:
             print("Error: Customer file not found!")
             sys.exit()
+        self.load_customer_rows(rows, filename)
+
+    def load_customer_rows(self, rows, filename=None):
+        """Adds the customers of parsed customer rows, applying the changes file saved next to filename if given."""
+        if filename:
+            changed_rows, self.changed_customers = read_changes(filename + '.changes', parse_customer_line)
+            rows = merge_changes(rows, changed_rows)
+        for row in rows:
+            self.load_customer_row(row)
+        # Customers as read match the files, until orders replay their rewards
+        self.mark_saved(self.customers)
+        self.saved_reward_rates = (BasicCustomer.reward_rate, VIPCustomer.reward_rate)
+
+    def load_customer_row(self, row):
+        """Creates a customer from a parsed customer row and adds them to the customer list."""
+        if row[0] == 'V':
+            _, customer_id, name, discount_rate, reward = row
+            customer = VIPCustomer(customer_id, name, reward, discount_rate)
+        else:
+            _, customer_id, name, reward_rate, reward = row
+            customer = BasicCustomer(customer_id, name, reward)
+            BasicCustomer.reward_rate = reward_rate
+        self.add_customer(customer)
     
     def read_products(self, filename):
         """Reads product and bundle data from a file and stores them in the product list."""
         try:
             with open(filename, 'r') as file:
-                for line in file:
-                    data = line.strip().split(', ')
-                    if data[0].startswith('B'):
-                        bundle_id = data[0]
-                        bundle_name = data[1]
-                        component_ids = data[2:]
-                        components = [self.find_product(pid) for pid in component_ids]
-                        bundle = Bundle(bundle_id, bundle_name, components)
-                        self.products.append(bundle)
-                    else:
-                        product_id, name, price, prescription = data
-                        product = Product(product_id, name, float(price), prescription)
-                        self.products.append(product)
+                rows = [row for row in map(parse_product_line, file) if row]
         except FileNotFoundError:
             print("Error: Product file not found!")
             sys.exit()
+        self.load_product_rows(rows, filename)
+
+    def load_product_rows(self, rows, filename=None):
+        """Creates the products and bundles of parsed product rows in file order and returns the errors of bundles left out."""
+        if filename:
+            changed_rows, self.changed_products = read_changes(filename + '.changes', parse_product_line)
+            rows = merge_changes(rows, changed_rows)
+        # A component is the earliest row whose ID or name matches, as find_product would pick
+        ids = {}
+        names = {}
+        for index, row in enumerate(rows):
+            ids.setdefault(row[1], index)
+            names.setdefault(row[2], index)
+        items = [Product(*row[1:]) if row[0] == 'P' else None for row in rows]
+        failed = {}
+
+        def resolve(key):
+            """Returns the row index or already loaded product a component key refers to, or None."""
+            positions = [position for position in (ids.get(key), names.get(key)) if position is not None]
+            return min(positions) if positions else self.find_product(key)
+
+        # Depth first with an explicit stack, so long chains of nested bundles cannot hit the recursion limit.
+        # Each frame is [row index, position of the next component key, components resolved so far].
+        for first in range(len(rows)):
+            if items[first] is not None or first in failed:
+                continue
+            stack = [[first, 0, []]]
+            on_stack = {first}
+            while stack:
+                frame = stack[-1]
+                index, position, components = frame
+                keys = rows[index][3]
+                while position < len(keys):
+                    key = keys[position]
+                    target = resolve(key)
+                    if target is None:
+                        failed[index] = f"component {key} does not exist"
+                    elif not isinstance(target, int):
+                        components.append(target)
+                        position += 1
+                        continue
+                    elif items[target] is not None:
+                        components.append(items[target])
+                        position += 1
+                        continue
+                    elif target in failed:
+                        failed[index] = f"component {rows[target][1]} was not loaded"
+                    elif target in on_stack:
+                        indexes = [entry[0] for entry in stack]
+                        cycle = [rows[entry][1] for entry in indexes[indexes.index(target):]]
+                        failed[index] = f"bundles {' -> '.join(cycle)} -> {rows[target][1]} contain each other"
+                    else:
+                        stack.append([target, 0, []])
+                        on_stack.add(target)
+                    break
+                frame[1] = position
+                if position == len(keys):
+                    items[index] = Bundle(rows[index][1], rows[index][2], components)
+                if index in failed or position == len(keys):
+                    stack.pop()
+                    on_stack.discard(index)
+
+        errors = [f"Error: Bundle {rows[index][1]} was not loaded: {reason}." for index, reason in sorted(failed.items())]
+        for error in errors:
+            print(error)
+        for index in sorted(failed):
+            product_id, name, keys = rows[index][1:]
+            self.unresolved_products.append((len(self.products) + index, f"{product_id}, {name}, {', '.join(keys)}\n"))
+            number = product_id[1:]
+            if number.isdigit():
+                self.last_product_number = max(self.last_product_number, int(number))
+        for item in items:
+            if item is not None:
+                self.add_product(item)
+        self.mark_saved(self.products)
+        return errors
     
-    def read_orders(self, filename):
+    def iter_order_rows(self, filename, start=None, end=None, customer=None):
+        """Yields the parsed rows of an order file and its partitions one at a time, skipping rows outside the date range."""
+        sources = []
+        if OrderPartitions.exists(filename):
+            customer_keys = (customer.get_id(), customer.get_name()) if customer else None
+            sources.append(OrderPartitions(filename).iter_lines(start, end, customer_keys))
+        sources.append(open(filename, 'r'))
+        try:
+            for source in sources:
+                for line in source:
+                    row = parse_order_line(line)
+                    if not row:
+                        continue
+                    if start is not None or end is not None:
+                        timestamp = to_epoch(row[5])
+                        if (start is not None and timestamp < start) or (end is not None and timestamp > end):
+                            continue
+                    yield row
+        finally:
+            sources[-1].close()
+
+    def build_order_history(self, row):
+        """Builds an order history object from a parsed order row."""
+        customer_id_or_name, product_ids, quantities, total_cost, earned_rewards, date_time = row
+        customer = self.find_customer(customer_id_or_name)
+        products = [self.find_product(product_id_or_name) for product_id_or_name in product_ids]
+        return OrderHistory(customer, products, quantities, total_cost, earned_rewards, date_time)
+
+    def load_order_row(self, row):
+        """Adds the order of a parsed order row to the order history and replays its earned rewards."""
+        order_history = self.build_order_history(row)
+        if order_history.customer is None:
+            print(f"Error: The order of unknown customer {row[0]} on {row[-1]} was not loaded.")
+            return
+        self.add_order(order_history)
+        if self.replay_rewards:
+            order_history.customer.update_reward(order_history.get_earned_rewards())
+
+    def read_parallel(self, customer_file, product_file, order_file, workers):
+        """Reads the customer, product and order files, parsing chunks of each in a process pool."""
+        with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+            def parse_rows(filename, parser, missing_message):
+                """Parses a file in chunks and returns its rows in file order."""
+                try:
+                    ranges = line_ranges(filename, workers * 4)
+                except FileNotFoundError:
+                    print(missing_message)
+                    sys.exit()
+                chunks = executor.map(parse_file_range, [parser] * len(ranges), [filename] * len(ranges),
+                                      [start for start, _ in ranges], [end for _, end in ranges])
+                return [row for rows in chunks for row in rows]
+
+            self.load_customer_rows(parse_rows(customer_file, parse_customer_line, "Error: Customer file not found!"), customer_file)
+            self.load_product_rows(parse_rows(product_file, parse_product_line, "Error: Product file not found!"), product_file)
+
+            try:
+                ranges = line_ranges(order_file, workers * 4)
+            except FileNotFoundError:
+                print("Cannot load the order file.\n")
+                return
+            chunks = executor.map(parse_order_range, [order_file] * len(ranges),
+                                  [start for start, _ in ranges], [end for _, end in ranges])
+            for chunk in chunks:
+                self.load_order_chunk(chunk)
+
+    def load_order_chunk(self, chunk):
+        """Adds the orders of a parsed order file chunk and replays their earned rewards."""
+        customer_fields, product_fields, line_counts, quantities, total_costs, earned_rewards, timestamps = chunk
+        find_customer, find_product = self.find_customer, self.find_product
+        # Resolve each distinct product field once per chunk
+        products = {field: find_product(field) for field in set(product_fields)}
+        offset = 0
+        for i, customer_field in enumerate(customer_fields):
+            end = offset + line_counts[i]
+            customer = find_customer(customer_field)
+            order_history = OrderHistory(customer, [products[field] for field in product_fields[offset:end]],
+                                         quantities[offset:end].tolist(), total_costs[i], earned_rewards[i], timestamps[i])
+            self.add_order(order_history)
+            if self.replay_rewards:
+                customer.update_reward(earned_rewards[i])
+            offset = end
+
+    def read_orders(self, filename, streaming=False, start=None, end=None):
         """Reads order history data from a file and stores them in the order history list."""
         try:
-            with open(filename, 'r') as file:
-                for line in file:
-                    data = line.strip().split(', ')
-                    customer_id_or_name = data[0]
-                    customer = self.find_customer(customer_id_or_name)
-                    total_cost = float(data[-3])
-                    earned_rewards = int(data[-2])
-                    date_time = data[-1]
-
-                    products = []
-                    quantities = []
-                    for i in range(1, len(data) - 3, 2):
-                        product_id_or_name = data[i]
-                        quantity = int(data[i+1])
-                        product = self.find_product(product_id_or_name)
-                        products.append(product)
-                        quantities.append(quantity)
-
-                    order_history = OrderHistory(customer,products,quantities, total_cost, earned_rewards, date_time)
-                    self.order_history.append(order_history)
-                    customer.update_reward(earned_rewards)
+            if streaming:
+                for row in self.iter_order_rows(filename):
+                    customer = self.find_customer(row[0])
+                    self._summary_for(customer.get_id()).record(row[3], row[4])
+                    if self.replay_rewards:
+                        customer.update_reward(row[4])
+                self.order_file = filename
+            else:
+                for row in self.iter_order_rows(filename, start, end):
+                    self.load_order_row(row)
+
+        except FileNotFoundError:
+            print("Cannot load the order file.\n")
 
+    def read_orders_archive(self, filename):
+        """Memory-maps the order file for read-only use, replaying rewards from its index."""
+        try:
+            self.order_archive = OrderArchive(filename)
         except FileNotFoundError:
             print("Cannot load the order file.\n")
+            return
+        for customer_id_or_name, (rows, spend, rewards) in self.order_archive.groups.items():
+            customer = self.find_customer(customer_id_or_name)
+            self.archive_rows.setdefault(customer.get_id(), []).append(rows)
+            self._summary_for(customer.get_id()).record(spend, rewards, len(rows))
+            if self.replay_rewards:
+                customer.update_reward(rewards)
+
+    def get_analytics(self):
+        """Returns the sales aggregates of every order"""
+        # Holding the orders lock keeps an order placed meanwhile from being missed by both the rebuild and add_order
+        with self.orders_lock:
+            if not self.analytics_complete:
+                for order in self.iter_order_history():
+                    self.analytics.record(order.get_customer_id(), order.products, order.quantities, order.get_total_cost(), order.get_timestamp())
+                self.analytics_complete = True
+        return self.analytics
+
+    def list_top_sales(self, count):
+        """Lists the best selling products and the customers who spent the most"""
+        analytics = self.get_analytics()
+        print(f"\nTop {count} products by revenue:")
+        print("Product ID\t Product Name\t Revenue\t Units".expandtabs(14))
+        for product_id, revenue in analytics.top_products(count):
+            product = self.find_product(product_id)
+            print(f"{product_id}\t {product.get_name() if product else '---'}\t {revenue:.2f}\t {analytics.product_units.get(product_id)}".expandtabs(14))
+        print(f"\nTop {count} customers by spend:")
+        print("Customer ID\t Name\t Spend\t Orders".expandtabs(14))
+        for customer_id, spend in analytics.top_customers(count):
+            customer = self.find_customer(customer_id)
+            orders = self.customer_summaries[customer_id].get_order_count() if customer_id in self.customer_summaries else 0
+            print(f"{customer_id}\t {customer.get_name() if customer else '---'}\t {spend:.2f}\t {orders}".expandtabs(14))
+
+    def list_daily_totals(self):
+        """Lists the revenue and number of orders of each day with sales"""
+        print("\nDaily sales totals:")
+        print("Date\t Revenue\t Orders".expandtabs(14))
+        for day, (revenue, orders) in sorted(self.get_analytics().daily_totals.items()):
+            print(f"{(EPOCH + datetime.timedelta(days=day)).strftime('%d/%m/%Y')}\t {revenue:.2f}\t {orders}".expandtabs(14))
+
+    def iter_order_history(self, start=None, end=None, customer=None):
+        """Yields every order history entry, rebuilding streamed orders from the order file."""
+        if self.order_archive:
+            for row in self.order_archive.iter_rows():
+                yield self.build_order_history(row)
+        if self.order_database:
+            for row in self.order_database.iter_order_rows(start, end, customer):
+                yield self.build_order_history(row)
+        if self.order_file:
+            for row in self.iter_order_rows(self.order_file, start, end, customer):
+                yield self.build_order_history(row)
+        if self.order_store is not None:
+            for row in range(len(self.order_store)):
+                yield self.order_store.view(row)
+        yield from self.order_history
 
     def find_customer(self, search_value):
         """Finds and returns a customer by their ID or name."""
-        for customer in self.customers:
-            if customer.get_id() == search_value or customer.get_name() == search_value:
-                return customer
-        return None
+        return self._find_indexed(self.customers, self.customer_ids, self.customer_names, search_value)
     
     def find_product(self, search_value):
         """Finds and returns a product by its ID or name."""
-        for product in self.products:
-            if product.get_id() == search_value or product.get_name() == search_value:
-                return product
-        return None
+        return self._find_indexed(self.products, self.product_ids, self.product_names, search_value)
+
+    def find_customers_by_name(self, name):
+        """Returns every customer sharing the given name, in list order."""
+        return [self.customers[position] for position in self.customer_names.get(name, [])]
+
+    def find_products_by_name(self, name):
+        """Returns every product sharing the given name, in list order."""
+        return [self.products[position] for position in self.product_names.get(name, [])]
     
+    def search_customers(self, text, limit=10):
+        """Returns up to limit customers ranked by how well their ID or name matches text, allowing typos"""
+        return self._search_indexed(self.customers, self.customer_ids, self.customer_search, text, limit)
+
+    def search_products(self, text, limit=10):
+        """Returns up to limit products ranked by how well their ID or name matches text, allowing typos"""
+        return self._search_indexed(self.products, self.product_ids, self.product_search, text, limit)
+
+    def _search_indexed(self, items, id_index, search_index, text, limit):
+        """Returns the item with ID text, if any, followed by the ranked name matches."""
+        id_position = id_index.get(text.strip())
+        positions = search_index.search(text, limit)
+        if id_position is not None:
+            positions = [id_position] + [position for position in positions if position != id_position][:limit - 1]
+        return [items[position] for position in positions]
+
     def find_orders(self, customer):
         """Find and return the order history of a given customer"""
-        return [history for history in self.order_history if customer.get_id() == history.get_customer_id() ]
-
-    def list_customers(self):
+        if self.order_archive:
+            numbers = sorted(number for rows in self.archive_rows.get(customer.get_id(), []) for number in rows)
+            return [self.build_order_history(row) for row in self.order_archive.iter_rows(numbers)]
+        if self.order_database:
+            return [self.build_order_history(row) for row in self.order_database.iter_order_rows(customer=customer)]
+        if self.order_file:
+            customer_id = customer.get_id()
+            return [history for history in self.iter_order_history(customer=customer) if history.get_customer_id() == customer_id]
+        if self.order_store is not None:
+            return [self.order_store.view(row) for row in self.customer_rows.get(customer.get_id(), [])]
+        return list(self.customer_orders.get(customer.get_id(), []))
+
+    def find_customer_summary(self, customer):
+        """Returns the running order totals of a given customer"""
+        return self.customer_summaries.get(customer.get_id(), CustomerSummary())
+
+    def list_customers(self, page_size=None, file=None):
         """Lists all existing customers."""
-        print("\nExisting Customers:")
-        print("Customer ID\t Name\t Reward Rate\t Discount Rate\t Reward".expandtabs(8))
-        for customer in self.customers:
-            customer.display_info()
+        print("\nExisting Customers:", file=file)
+        print("Customer ID\t Name\t Reward Rate\t Discount Rate\t Reward".expandtabs(8), file=file)
+        write_paged((customer.format_info() for customer in self.customers), page_size, file=file)
     
-    def list_products(self):
+    def list_products(self, page_size=None, file=None):
         """Lists all existing products and Bundles."""
-        print("\nExisting Products:")
-        print("Product ID\t Product Name\t Price\t Dr Prescription\t Bundle".expandtabs(7))
-        for product in self.products:
-            product.display_info()
-            # print(product.requires_prescription())
+        print("\nExisting Products:", file=file)
+        print("Product ID\t Product Name\t Price\t Dr Prescription\t Bundle".expandtabs(7), file=file)
+        write_paged((product.format_info() for product in self.products), page_size, file=file)
     
-    def list_orders(self):
-        """Lists all completed order's history"""
-        print("\nOrder history of all customers:")
-        print(f"Name\t {'Products':<19} {'Total Cost':<10} Rewards\t Order Time".expandtabs(7))
-        for order in self.order_history:
-            order.display_info()
+    def list_orders(self, page_size=None, file=None, **filters):
+        """Lists all completed order's history, optionally filtered as in iter_filtered_orders"""
+        print("\nOrder history of all customers:", file=file)
+        print(f"Name\t {'Products':<19} {'Total Cost':<10} Rewards\t Order Time".expandtabs(7), file=file)
+        write_paged((order.format_info() for order in self.iter_filtered_orders(**filters)), page_size, file=file)
+
+    def iter_filtered_orders(self, start=None, end=None, customer=None, product=None):
+        """Yields the orders placed between two date times (inclusive) by a customer and containing a product, each filter being optional"""
+        start = to_epoch(start) if start is not None else None
+        end = to_epoch(end) if end is not None else None
+        for order in self.find_orders(customer) if customer else self.iter_order_history(start, end):
+            if start is not None and order.get_timestamp() < start:
+                continue
+            if end is not None and order.get_timestamp() > end:
+                continue
+            if product and not any(item is product for item in order.products):
+                continue
+            yield order
+
+    def iter_customer_records(self):
+        """Yields a dictionary of fields for each customer"""
+        for customer in self.customers:
+            yield {'id': customer.get_id(), 'name': customer.get_name(), 'type': 'VIP' if isinstance(customer, VIPCustomer) else 'Basic',
+                   'reward_rate': customer.reward_rate, 'discount_rate': customer.get_discount_rate() if isinstance(customer, VIPCustomer) else None,
+                   'reward': customer.get_current_reward()}
+
+    def iter_product_records(self):
+        """Yields a dictionary of fields for each product and bundle"""
+        for product in self.products:
+            yield {'id': product.get_id(), 'name': product.get_name(), 'price': round(product.get_price(), 2),
+                   'prescription': product.requires_prescription(),
+                   'components': ' '.join(component.get_id() for component in product.products) if isinstance(product, Bundle) else ''}
+
+    def iter_order_records(self, **filters):
+        """Yields a dictionary of fields for each order, filtered as in iter_filtered_orders"""
+        for order in self.iter_filtered_orders(**filters):
+            yield {'customer_id': order.get_customer_id(), 'customer_name': order.customer.get_name(),
+                   'products': ' '.join(f'{product.get_id()}x{quantity}' for product, quantity in zip(order.products, order.quantities)),
+                   'total_cost': order.get_total_cost(), 'earned_rewards': order.get_earned_rewards(), 'date_time': order.get_date_time()}
 
     def highest_id_number(self):
         """Returns the highest customer ID number."""
@@ -367,46 +1652,775 @@ class Records:
         return int(last_customer_id[1:])
 
     def add_or_update_product(self, name, price, prescription):
-        """Adds a new product or updates an existing product's price and prescription requirement."""
-        product:Product = self.find_product(name)
-        if product:
-            product.update_price(price)
-            product.update_prescription(prescription)
-        else:
-            new_id = f"P{len(self.products) + 1}"
-            new_product = Product(new_id, name, price, prescription)
-            self.products.append(new_product) 
-
-    def save_customers(self, filename):
+        """Adds a new product or updates an existing product's price and prescription requirement, and returns it."""
+        with self.products_lock:
+            product:Product = self.find_product(name)
+            if product:
+                product.update_price(price)
+                product.update_prescription(prescription)
+                return product
+            else:
+                new_product = Product(self.allocate_product_id(), name, price, prescription)
+                self.add_product(new_product)
+                return new_product
+
+    def upsert_products(self, rows):
+        """Adds or updates products from (name, price, prescription) rows and returns the added and the updated products."""
+        added = []
+        updated = []
+        with self.products_lock:
+            for name, price, prescription in rows:
+                product = self.find_product(name)
+                if product is None:
+                    product = Product(self.allocate_product_id(), name, price, prescription)
+                    self.add_product(product)
+                    added.append(product)
+                else:
+                    product.price = price
+                    product.prescription = prescription
+                    product.unsaved = True
+                    updated.append(product)
+        return added, updated
+
+    def finish_product_updates(self, updated):
+        """Recomputes each bundle containing an updated product, directly or through other bundles, once and returns how many there were."""
+        with self.products_lock:
+            affected = set()
+            pending = list(updated)
+            while pending:
+                for bundle in pending.pop().bundles:
+                    if bundle not in affected:
+                        affected.add(bundle)
+                        pending.append(bundle)
+            for bundle in affected:
+                bundle.dirty = True
+            # Refreshing a bundle refreshes its stale components first, so each one is computed once
+            for bundle in affected:
+                if bundle.dirty:
+                    bundle.refresh()
+        return len(affected)
+
+    def read_snapshot(self, filename):
+        """Reads customers, products and order history from a binary snapshot file."""
+        with open(filename, 'rb') as file:
+            buffer = memoryview(file.read())
+        magic, version, little_endian, basic_reward_rate = SNAPSHOT_HEADER.unpack_from(buffer, 0)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            raise ValueError(f"{filename} is not a version {SNAPSHOT_VERSION} snapshot.")
+        swap = bool(little_endian) != (sys.byteorder == 'little')
+        offset = SNAPSHOT_HEADER.size
+        BasicCustomer.reward_rate = basic_reward_rate
+
+        count, = SNAPSHOT_COUNT.unpack_from(buffer, offset)
+        offset += SNAPSHOT_COUNT.size
+        for _ in range(count):
+            customer_id, offset = _unpack_string(buffer, offset)
+            name, offset = _unpack_string(buffer, offset)
+            is_vip, discount_rate, reward = SNAPSHOT_CUSTOMER.unpack_from(buffer, offset)
+            offset += SNAPSHOT_CUSTOMER.size
+            if is_vip:
+                self.add_customer(VIPCustomer(customer_id, name, reward, discount_rate))
+            else:
+                self.add_customer(BasicCustomer(customer_id, name, reward))
+
+        count, = SNAPSHOT_COUNT.unpack_from(buffer, offset)
+        offset += SNAPSHOT_COUNT.size
+        products = []
+        for _ in range(count):
+            product_id, offset = _unpack_string(buffer, offset)
+            name, offset = _unpack_string(buffer, offset)
+            is_bundle, price, prescription, component_count = SNAPSHOT_PRODUCT.unpack_from(buffer, offset)
+            offset += SNAPSHOT_PRODUCT.size
+            components, offset = _unpack_array('i', buffer, offset, component_count, swap)
+            products.append((product_id, name, price, prescription.decode(), components if is_bundle else None))
+        # Bundles may come before the bundles they contain, so they are built in dependency order like the text file
+        self.load_product_rows([('B', product_id, name, [products[index][0] for index in components]) if components is not None
+                                else ('P', product_id, name, price, prescription)
+                                for product_id, name, price, prescription, components in products])
+        self.mark_saved(self.customers)
+
+        count, = SNAPSHOT_COUNT.unpack_from(buffer, offset)
+        offset += SNAPSHOT_COUNT.size
+        customer_index, offset = _unpack_array('i', buffer, offset, count, swap)
+        total_cost, offset = _unpack_array('d', buffer, offset, count, swap)
+        earned_rewards, offset = _unpack_array('i', buffer, offset, count, swap)
+        timestamp, offset = _unpack_array('q', buffer, offset, count, swap)
+        line_start, offset = _unpack_array('q', buffer, offset, count + 1, swap)
+        line_products, offset = _unpack_array('i', buffer, offset, line_start[-1], swap)
+        line_quantities, offset = _unpack_array('i', buffer, offset, line_start[-1], swap)
+
+        if self.order_store is not None:
+            store = self.order_store
+            store.customer_index, store.total_cost, store.earned_rewards = customer_index, total_cost, earned_rewards
+            store.timestamp, store.line_start = timestamp, line_start
+            store.line_products, store.line_quantities = line_products, line_quantities
+        for row in range(count):
+            customer = self.customers[customer_index[row]]
+            if self.order_store is not None:
+                self.customer_rows.setdefault(customer.get_id(), array('i')).append(row)
+                self._summary_for(customer.get_id()).record(total_cost[row], earned_rewards[row])
+            else:
+                start, end = line_start[row], line_start[row + 1]
+                self.add_order(OrderHistory(customer, [self.products[index] for index in line_products[start:end]],
+                                            line_quantities[start:end].tolist(), total_cost[row], earned_rewards[row], timestamp[row]))
+            # Rewards are replayed exactly as read_orders does for the text files
+            if self.replay_rewards:
+                customer.update_reward(earned_rewards[row])
+
+    def save_snapshot(self, filename, loaded_rewards=False):
+        """Write customers, products and order history to a binary snapshot file."""
+        chunks = [SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, sys.byteorder == 'little', BasicCustomer.reward_rate)]
+
+        chunks.append(SNAPSHOT_COUNT.pack(len(self.customers)))
+        customer_positions = {}
+        for position, customer in enumerate(self.customers):
+            customer_positions[id(customer)] = position
+            reward = customer.get_current_reward()
+            if loaded_rewards:
+                reward -= self.find_customer_summary(customer).get_total_rewards()
+            is_vip = isinstance(customer, VIPCustomer)
+            chunks.append(_pack_string(customer.get_id()) + _pack_string(customer.get_name()))
+            chunks.append(SNAPSHOT_CUSTOMER.pack(is_vip, customer.get_discount_rate() if is_vip else 0.0, reward))
+
+        chunks.append(SNAPSHOT_COUNT.pack(len(self.products)))
+        product_positions = {id(product): position for position, product in enumerate(self.products)}
+        for product in self.products:
+            components = array('i', [product_positions[id(component)] for component in product.products]) if isinstance(product, Bundle) else array('i')
+            chunks.append(_pack_string(product.get_id()) + _pack_string(product.get_name()))
+            chunks.append(SNAPSHOT_PRODUCT.pack(isinstance(product, Bundle), product.get_price(),
+                                                product.requires_prescription().encode(), len(components)))
+            chunks.append(components.tobytes())
+
+        store = OrderStore(self.customers, self.products)
+        for order in self.iter_order_history():
+            store.append(customer_positions[id(order.customer)], [product_positions[id(product)] for product in order.products],
+                         order.quantities, order.get_total_cost(), order.get_earned_rewards(), order.get_timestamp())
+        chunks.append(SNAPSHOT_COUNT.pack(len(store)))
+        for column in (store.customer_index, store.total_cost, store.earned_rewards, store.timestamp,
+                       store.line_start, store.line_products, store.line_quantities):
+            chunks.append(column.tobytes())
+
+        temp_filename = filename + '.tmp'
+        with open(temp_filename, 'wb') as file:
+            file.writelines(chunks)
+        os.replace(temp_filename, filename)
+
+    def mark_saved(self, items):
+        """Clears the unsaved flag of customers or products."""
+        for item in items:
+            item.unsaved = False
+
+    def customers_unsaved(self):
+        """Returns whether the customer file is missing changes, including ones only in its changes file."""
+        return (bool(self.changed_customers) or self.saved_reward_rates != (BasicCustomer.reward_rate, VIPCustomer.reward_rate)
+                or any(customer.unsaved for customer in self.customers))
+
+    def products_unsaved(self):
+        """Returns whether the product file is missing changes, including ones only in its changes file."""
+        return bool(self.changed_products) or any(product.unsaved for product in self.products)
+
+    def save_customers(self, filename, loaded_rewards=False):
         """Write the details of current existing customers in the file"""
-        with open(filename, 'w') as file:
-            for customer in self.customers:
-                file.write(f"{customer.get_id()}, {customer.get_name()}, {customer.reward_rate}, {f'{customer.get_discount_rate()}, ' if isinstance(customer, VIPCustomer) else ''}{customer.get_current_reward()}\n")
+        with self.save_lock:
+            customers = list(self.customers)
+            # Flags are cleared before formatting, so a change made while saving is kept for the next save
+            self.mark_saved(customers)
+            if loaded_rewards:
+                lines = (customer.format_record(customer.get_current_reward() - self.find_customer_summary(customer).get_total_rewards()) for customer in customers)
+            else:
+                lines = (customer.format_record(customer.get_current_reward()) for customer in customers)
+            write_atomically(filename, lines)
+            self.changed_customers.clear()
+            self.new_customers.difference_update(customer.get_id() for customer in customers)
+            self.saved_reward_rates = (BasicCustomer.reward_rate, VIPCustomer.reward_rate)
+            if os.path.isfile(filename + '.changes'):
+                os.remove(filename + '.changes')
 
     def save_products(self, filename):
         """Write the details of current existing products in the file"""
-        with open(filename, 'w') as file:
-            for product in self.products:
-                if product.get_id().startswith('B'):
-                    file.write(f"{product.get_id()}, {product.get_name()}, {', '.join(product.get_id() for product in product.products)}\n")
-                    
-                else:
-                    file.write(f"{product.get_id()}, {product.get_name()}, {product.get_price()}, {product.requires_prescription()}\n")
+        with self.save_lock:
+            products = list(self.products)
+            self.mark_saved(products)
+            lines = [product.format_record() for product in products]
+            for line_number, line in self.unresolved_products:
+                lines.insert(line_number, line)
+            write_atomically(filename, lines)
+            self.changed_products.clear()
+            if os.path.isfile(filename + '.changes'):
+                os.remove(filename + '.changes')
+
+    def save_customer_changes(self, customer_file):
+        """Writes only the customers changed since the last save, to a changes file next to the customer file, and returns how many."""
+        with self.save_lock:
+            if self.saved_reward_rates != (BasicCustomer.reward_rate, VIPCustomer.reward_rate):
+                # A reward rate change touches every customer line
+                self.save_customers(customer_file)
+                return len(self.customers)
+            return self._save_changed(self.customers, self.changed_customers, customer_file + '.changes',
+                                      lambda customer: customer.format_record(customer.get_current_reward()))
+
+    def save_new_customer(self, customer, customer_file):
+        """Writes a customer created by a purchase to the customer changes file with no reward, as replaying their orders adds it."""
+        with self.save_lock:
+            if customer.get_id() not in self.new_customers:
+                return
+            self.new_customers.discard(customer.get_id())
+            if customer.get_id() not in self.changed_customers:
+                self.changed_customers[customer.get_id()] = customer.format_record(0)
+                write_atomically(customer_file + '.changes', list(self.changed_customers.values()))
+
+    def save_product_changes(self, product_file):
+        """Writes only the products changed since the last save, to a changes file next to the product file, and returns how many."""
+        return self._save_changed(self.products, self.changed_products, product_file + '.changes', lambda product: product.format_record())
+
+    def _save_changed(self, items, changes, filename, format_record):
+        """Adds the unsaved items to the changes and rewrites the changes file if there were any."""
+        with self.save_lock:
+            changed = [item for item in items if item.unsaved]
+            if not changed:
+                return 0
+            for item in changed:
+                item.unsaved = False
+                changes[item.get_id()] = format_record(item)
+            write_atomically(filename, list(changes.values()))
+            return len(changed)
+
+    def format_order(self, order):
+        """Returns the order file line of a completed order"""
+        return f"{order.customer.get_name()}, {', '.join(', '.join((product.get_id(), str(quantity))) for product,quantity in zip(order.products, order.quantities))}, {order.get_total_cost()}, {order.get_earned_rewards()}, {order.get_date_time()}\n"
 
     def save_orders(self, filename):
         """Write the details of completed orders in the file"""
-        with open(filename, 'w') as file:
-            for order in self.order_history:
-                file.write(f"{order.customer.get_name()}, {', '.join(', '.join((product.get_id(), str(quantity))) for product,quantity in zip(order.products, order.quantities))}, {order.get_total_cost()}, {order.get_earned_rewards()}, {order.get_date_time()}\n")
+        # Streamed orders are read back from the order file while saving, so write to a temporary file first
+        write_atomically(filename, (self.format_order(order) for order in self.iter_order_history()))
+        # Every order is now in the order file itself
+        OrderPartitions(filename).remove()
+
+    def orders_compacted(self):
+        """Drops in-memory copies of session orders once they are in the streamed order file"""
+        if self.order_file:
+            self.order_history.clear()
+            self.customer_orders.clear()
+            self.customer_rows.clear()
+            if self.order_store is not None:
+                self.order_store.clear()
+
+# OrderJournal class
+class OrderJournal:
+    def __init__(self, filename, batch_size=1, fsync=False):
+        """Initializes a write-ahead journal of completed orders stored next to the order file."""
+        self.filename = filename
+        self.batch_size = batch_size
+        self.fsync = fsync
+        self.pending = []
+        self.lock = threading.RLock()
+
+    def append(self, line):
+        """Queues an order line and writes the batch once it is full."""
+        with self.lock:
+            self.pending.append(line)
+            if len(self.pending) >= self.batch_size:
+                self.flush()
+
+    def flush(self):
+        """Writes the queued order lines to the journal file."""
+        with self.lock:
+            if not self.pending:
+                return
+            with open(self.filename, 'a') as file:
+                file.writelines(self.pending)
+                file.flush()
+                if self.fsync:
+                    os.fsync(file.fileno())
+            self.pending.clear()
+
+    def has_entries(self):
+        """Returns whether the journal holds orders not yet compacted."""
+        return bool(self.pending) or (os.path.isfile(self.filename) and os.path.getsize(self.filename) > 0)
+
+    @staticmethod
+    def recover(filename, order_file):
+        """Undoes a compaction interrupted before its journal was removed, so the journal is replayed exactly once."""
+        marker = filename + '.compacting'
+        if not os.path.isfile(marker):
+            return
+        # With the journal still there its orders may be partly or wholly in the order file already
+        if os.path.isfile(filename):
+            with open(marker, 'r') as file:
+                offset = int(file.read())
+            with open(order_file, 'r+b') as file:
+                file.truncate(offset)
+        os.remove(marker)
+
+    def compact(self, order_file):
+        """Appends the journaled orders to the order file and empties the journal."""
+        with self.lock:
+            self.flush()
+            if not os.path.isfile(self.filename):
+                return
+            # The marker records where the order file ended, in case the append is interrupted
+            marker = self.filename + '.compacting'
+            size = os.path.getsize(order_file)
+            write_atomically(marker, [str(size)])
+            with open(order_file, 'rb') as file:
+                file.seek(max(size - 1, 0))
+                last_byte = file.read(1)
+            with open(self.filename, 'r') as journal, open(order_file, 'a') as file:
+                # An order file edited by hand may lack its final newline
+                if last_byte not in (b'', b'\n'):
+                    file.write('\n')
+                for line in journal:
+                    file.write(line)
+                file.flush()
+                if self.fsync:
+                    os.fsync(file.fileno())
+            os.remove(self.filename)
+            os.remove(marker)
+
+# RewardLedger class, an append-only log of reward events with periodic balance checkpoints
+class RewardLedger:
+    def __init__(self, directory, checkpoint_every=1000, keep_checkpoints=5, fsync=False):
+        """Initializes a ledger stored in the given directory."""
+        self.directory = directory
+        # Each ledger line is: sequence, customer ID, event, points, balance after the event, date time
+        self.ledger_file = os.path.join(directory, 'ledger.txt')
+        self.checkpoint_every = checkpoint_every
+        self.keep_checkpoints = keep_checkpoints
+        self.fsync = fsync
+        # Materialised balances and the number of orders the ledger has seen
+        self.balances = {}
+        self.order_count = 0
+        self.sequence = 0
+        self.events_since_checkpoint = 0
+        self.file = None
+        self.lock = threading.RLock()
+
+    @staticmethod
+    def exists(directory):
+        """Returns whether a ledger with at least one checkpoint is stored in the directory."""
+        return os.path.isdir(directory) and any(name.startswith('checkpoint-') for name in os.listdir(directory))
+
+    def checkpoints(self):
+        """Returns the sequence numbers of the kept checkpoints, oldest first."""
+        return sorted(int(name[11:-5]) for name in os.listdir(self.directory) if name.startswith('checkpoint-') and name.endswith('.json'))
+
+    def read_checkpoint(self, sequence):
+        """Returns the contents of a checkpoint."""
+        with open(os.path.join(self.directory, f"checkpoint-{sequence}.json"), 'r') as file:
+            return json.load(file)
+
+    def replay(self, balances, offset=0):
+        """Applies the ledger events from a byte offset to balances and returns the earn count, last sequence and mismatches."""
+        orders = 0
+        sequence = 0
+        mismatches = []
+        if not os.path.isfile(self.ledger_file):
+            return orders, sequence, mismatches
+        with open(self.ledger_file, 'rb') as file:
+            file.seek(offset)
+            for line in file:
+                if not line.endswith(b'\n'):
+                    break # an event cut short by a crash
+                sequence, customer_id, kind, points, balance, _ = line.decode().rstrip('\n').split(', ')
+                points, balance = int(points), int(balance)
+                if kind == 'open':
+                    balances[customer_id] = points
+                else:
+                    balances[customer_id] = balances.get(customer_id, 0) + points
+                    orders += kind == 'earn'
+                if balances[customer_id] != balance:
+                    mismatches.append((int(sequence), customer_id, balances[customer_id], balance))
+        return orders, int(sequence), mismatches
+
+    def load(self, order_count):
+        """Returns the balances from the latest checkpoint and the events after it, or None if the ledger missed orders."""
+        checkpoint = self.read_checkpoint(self.checkpoints()[-1])
+        balances = checkpoint['balances']
+        orders, sequence, _ = self.replay(balances, checkpoint['offset'])
+        self.sequence = max(sequence, checkpoint['sequence'])
+        if checkpoint['orders'] + orders != order_count:
+            return None
+        self.balances = balances
+        self.order_count = order_count
+        return balances
+
+    def start(self, balances, order_count):
+        """Opens every balance as a new starting point of the ledger and checkpoints it."""
+        os.makedirs(self.directory, exist_ok=True)
+        with self.lock:
+            if not self.sequence:
+                # Events logged before a crash that came ahead of the first checkpoint keep their numbers
+                self.sequence = self.replay({})[1]
+            self.order_count = order_count
+            for customer_id, balance in balances.items():
+                self.record(customer_id, 'open', balance, balance, checkpoint=False)
+            self.checkpoint()
+
+    def record(self, customer_id, kind, points, balance, checkpoint=True):
+        """Appends an open, earn or redeem event with the customer's balance after it."""
+        with self.lock:
+            if self.file is None:
+                self.file = open(self.ledger_file, 'a')
+            self.sequence += 1
+            self.file.write(f"{self.sequence}, {customer_id}, {kind}, {points}, {balance}, {from_epoch(to_epoch(datetime.datetime.now()))}\n")
+            self.file.flush()
+            if self.fsync:
+                os.fsync(self.file.fileno())
+            self.balances[customer_id] = balance
+            self.order_count += kind == 'earn'
+            self.events_since_checkpoint += 1
+            if checkpoint and self.events_since_checkpoint >= self.checkpoint_every:
+                self.checkpoint()
+
+    def checkpoint(self):
+        """Writes the materialised balances and drops the oldest checkpoints beyond keep_checkpoints."""
+        with self.lock:
+            if self.file:
+                self.file.flush()
+            offset = os.path.getsize(self.ledger_file) if os.path.isfile(self.ledger_file) else 0
+            write_atomically(os.path.join(self.directory, f"checkpoint-{self.sequence}.json"),
+                             [json.dumps({'sequence': self.sequence, 'offset': offset, 'orders': self.order_count, 'balances': self.balances})])
+            self.events_since_checkpoint = 0
+            for sequence in self.checkpoints()[:-self.keep_checkpoints]:
+                os.remove(os.path.join(self.directory, f"checkpoint-{sequence}.json"))
+
+    def verify(self):
+        """Recomputes the balances from the start of the ledger and from every kept checkpoint and returns any problems."""
+        problems = []
+        balances = {}
+        _, _, mismatches = self.replay(balances)
+        problems.extend(f"Event {sequence}: {customer_id} has {computed} points but {recorded} were recorded."
+                        for sequence, customer_id, computed, recorded in mismatches)
+        starts = [("the start of the ledger", balances)]
+        for sequence in self.checkpoints():
+            checkpoint = self.read_checkpoint(sequence)
+            self.replay(checkpoint['balances'], checkpoint['offset'])
+            starts.append((f"checkpoint {sequence}", checkpoint['balances']))
+        for start, recomputed in starts:
+            for customer_id, balance in self.balances.items():
+                if recomputed.get(customer_id, 0) != balance:
+                    problems.append(f"From {start}: {customer_id} recomputes to {recomputed.get(customer_id, 0)} points, not {balance}.")
+        return problems
+
+    def history(self, customer_id):
+        """Returns the (sequence, event, points, balance, date time) events of a customer, oldest first."""
+        events = []
+        with open(self.ledger_file, 'r') as file:
+            for line in file:
+                fields = line.rstrip('\n').split(', ')
+                if len(fields) == 6 and fields[1] == customer_id:
+                    events.append((int(fields[0]), fields[2], int(fields[3]), int(fields[4]), fields[5]))
+        return events
+
+    def close(self):
+        """Checkpoints the ledger and closes the log file."""
+        with self.lock:
+            if self.events_since_checkpoint:
+                self.checkpoint()
+            if self.file:
+                self.file.close()
+                self.file = None
+
+# TextStorage class, the storage backend for the comma separated text files
+class TextStorage:
+    def __init__(self, customer_file, product_file, order_file, snapshot_file=None, read_only=False, load_workers=0,
+                 journal_batch=1, journal_fsync=False, compact_every=100):
+        """Initializes the backend with the paths of the text files and how they are loaded and journaled."""
+        self.customer_file = customer_file
+        self.product_file = product_file
+        self.order_file = order_file
+        self.snapshot_file = snapshot_file
+        self.read_only = read_only
+        self.load_workers = load_workers
+        self.journal_batch = journal_batch
+        self.journal_fsync = journal_fsync
+        self.compact_every = compact_every
+        self.journal = None
+        self.orders_since_compaction = 0
+
+    def load(self, records, stream_orders=False, order_range=None):
+        """Reads the customers, products and orders into the records, then replays orders left in the journal."""
+        customer_file, product_file, order_file = self.customer_file, self.product_file, self.order_file
+        if not self.read_only and os.path.isfile(order_file):
+            OrderPartitions.recover(order_file)
+            OrderJournal.recover(order_file + '.journal', order_file)
+        # The archive and the parallel loader only read the order file itself, not its partitions
+        whole_file = order_range is None and not OrderPartitions.exists(order_file)
+        if self.read_only and whole_file:
+            # Reporting terminals map the order file instead of loading it
+            records.read_customers(customer_file)
+            records.read_products(product_file)
+            records.read_orders_archive(order_file)
+        elif not stream_orders and order_range is None and snapshot_is_current(self.snapshot_file, (
+                customer_file, product_file, order_file, customer_file + '.changes', product_file + '.changes',
+                os.path.join(order_file + '.partitions', 'manifest.json'))):
+            records.read_snapshot(self.snapshot_file)
+        elif self.load_workers > 1 and not stream_orders and whole_file:
+            records.read_parallel(customer_file, product_file, order_file, self.load_workers)
+        else:
+            records.read_customers(customer_file)
+            records.read_products(product_file)
+            records.read_orders(order_file, stream_orders, *(order_range or (None, None)))
+
+        # Completed orders are journaled next to the order file instead of rewriting it
+        if os.path.isfile(order_file) and not self.read_only:
+            self.journal = OrderJournal(order_file + '.journal', self.journal_batch, self.journal_fsync)
+            if self.journal.has_entries():
+                for row in records.iter_order_rows(self.journal.filename):
+                    records.load_order_row(row)
+                self.compact(records)
+
+    def append_order(self, records, order):
+        """Journals a completed order and periodically folds the journal into the order file."""
+        if self.journal:
+            # A customer created by the purchase is written first, so replaying the journal finds them
+            records.save_new_customer(order.customer, self.customer_file)
+            with self.journal.lock:
+                self.journal.append(records.format_order(order))
+                self.orders_since_compaction += 1
+                if self.orders_since_compaction >= self.compact_every:
+                    self.compact(records)
+
+    def compact(self, records):
+        """Moves journaled orders into the main order file."""
+        if self.journal:
+            with self.journal.lock, records.orders_lock:
+                self.journal.compact(self.order_file)
+                records.orders_compacted()
+                self.orders_since_compaction = 0
+
+    def upsert_products(self, records, products):
+        """Writes the changed products, these included, to the product changes file."""
+        records.save_product_changes(self.product_file)
+
+    def update_customers(self, records, customers):
+        """Writes the changed customers, these included, to the customer changes file."""
+        records.save_customer_changes(self.customer_file)
+
+    def save(self, records):
+        """Rewrites the customer and product files if anything in them changed, folds in the journal and refreshes the snapshot."""
+        if records.customers_unsaved():
+            records.save_customers(self.customer_file)
+        if records.products_unsaved():
+            records.save_products(self.product_file)
+        self.compact(records)
+        # Refresh an existing snapshot so it stays newer than the text files, unless it would lose unloaded bundles
+        if self.snapshot_file and os.path.isfile(self.snapshot_file) and not records.unresolved_products:
+            records.save_snapshot(self.snapshot_file)
+
+    def save_changes(self, records):
+        """Flushes journaled orders and writes the changed customers and products to the changes files."""
+        if self.journal:
+            self.journal.flush()
+        return records.save_customer_changes(self.customer_file) + records.save_product_changes(self.product_file)
+
+    def close(self):
+        """Nothing to release for the text files."""
+
+# SQLiteStorage class, the storage backend for an SQLite database in WAL mode
+class SQLiteStorage:
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS customers (position INTEGER PRIMARY KEY, id TEXT NOT NULL, name TEXT NOT NULL,
+            vip INTEGER NOT NULL, reward_rate REAL NOT NULL, discount_rate REAL, reward INTEGER NOT NULL);
+        CREATE INDEX IF NOT EXISTS customers_id ON customers (id);
+        CREATE INDEX IF NOT EXISTS customers_name ON customers (name);
+        CREATE TABLE IF NOT EXISTS products (position INTEGER PRIMARY KEY, id TEXT NOT NULL, name TEXT NOT NULL,
+            price REAL, prescription TEXT, components TEXT);
+        CREATE INDEX IF NOT EXISTS products_id ON products (id);
+        CREATE INDEX IF NOT EXISTS products_name ON products (name);
+        CREATE TABLE IF NOT EXISTS orders (id INTEGER PRIMARY KEY, customer_id TEXT NOT NULL, products TEXT NOT NULL,
+            quantities TEXT NOT NULL, total_cost REAL NOT NULL, earned_rewards INTEGER NOT NULL, timestamp INTEGER NOT NULL);
+        CREATE INDEX IF NOT EXISTS orders_customer ON orders (customer_id, timestamp);
+        CREATE INDEX IF NOT EXISTS orders_timestamp ON orders (timestamp);
+    """
+
+    def __init__(self, filename, fsync=False):
+        """Opens or creates the database file."""
+        self.filename = filename
+        self.connection = sqlite3.connect(filename, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(f"PRAGMA synchronous={'FULL' if fsync else 'NORMAL'}")
+        self.connection.executescript(self.SCHEMA)
+        self.lock = threading.RLock()
+
+    def is_empty(self):
+        """Returns whether the database holds no customers yet."""
+        return self.connection.execute("SELECT COUNT(*) FROM customers").fetchone()[0] == 0
+
+    def customer_row(self, position, customer, reward):
+        """Returns the database row of a customer."""
+        is_vip = isinstance(customer, VIPCustomer)
+        return (position, customer.get_id(), customer.get_name(), is_vip, customer.reward_rate,
+                customer.get_discount_rate() if is_vip else None, reward)
+
+    def product_row(self, position, product):
+        """Returns the database row of a product or bundle."""
+        if isinstance(product, Bundle):
+            return (position, product.get_id(), product.get_name(), None, None, ' '.join(component.get_id() for component in product.products))
+        return (position, product.get_id(), product.get_name(), product.get_price(), product.requires_prescription(), None)
+
+    def order_row(self, order):
+        """Returns the database row of an order history entry."""
+        return (order.get_customer_id(), ' '.join(product.get_id() for product in order.products),
+                ' '.join(str(quantity) for quantity in order.quantities), order.get_total_cost(), order.get_earned_rewards(), order.get_timestamp())
+
+    def write_all(self, records, loaded_rewards=False):
+        """Replaces the database contents with the customers, products and orders of the records."""
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM customers")
+            self.connection.execute("DELETE FROM products")
+            self.connection.execute("DELETE FROM orders")
+            self.connection.executemany("INSERT INTO customers VALUES (?, ?, ?, ?, ?, ?, ?)", (
+                self.customer_row(position, customer, customer.get_current_reward()
+                                  - (records.find_customer_summary(customer).get_total_rewards() if loaded_rewards else 0))
+                for position, customer in enumerate(records.customers)))
+            self.connection.executemany("INSERT INTO products VALUES (?, ?, ?, ?, ?, ?)",
+                                        (self.product_row(position, product) for position, product in enumerate(records.products)))
+            self.connection.executemany("INSERT INTO orders (customer_id, products, quantities, total_cost, earned_rewards, timestamp) VALUES (?, ?, ?, ?, ?, ?)",
+                                        (self.order_row(order) for order in records.iter_order_history()))
+
+    def load(self, records, stream_orders=False, order_range=None):
+        """Reads the customers and products into the records and the per-customer order totals."""
+        with self.lock:
+            customers = self.connection.execute("SELECT vip, id, name, reward_rate, discount_rate, reward FROM customers ORDER BY position")
+            records.load_customer_rows([('V', customer_id, name, discount_rate, reward) if vip else ('B', customer_id, name, reward_rate, reward)
+                                        for vip, customer_id, name, reward_rate, discount_rate, reward in customers])
+            products = self.connection.execute("SELECT id, name, price, prescription, components FROM products ORDER BY position")
+            records.load_product_rows([('B', product_id, name, components.split()) if components is not None else ('P', product_id, name, price, prescription)
+                                       for product_id, name, price, prescription, components in products])
+            totals = self.connection.execute("SELECT customer_id, COUNT(*), SUM(total_cost), SUM(earned_rewards) FROM orders GROUP BY customer_id").fetchall()
+        for customer_id, count, spend, rewards in totals:
+            customer = records.find_customer(customer_id)
+            records._summary_for(customer.get_id()).record(spend, rewards, count)
+            if records.replay_rewards:
+                customer.update_reward(rewards)
+        records.order_database = self
+
+    def order_filter(self, start=None, end=None, customer=None):
+        """Returns the WHERE clause and parameters selecting orders by date range and customer."""
+        conditions = []
+        parameters = []
+        if customer is not None:
+            conditions.append("customer_id = ?")
+            parameters.append(customer.get_id())
+        if start is not None:
+            conditions.append("timestamp >= ?")
+            parameters.append(start)
+        if end is not None:
+            conditions.append("timestamp <= ?")
+            parameters.append(end)
+        return (" WHERE " + " AND ".join(conditions) if conditions else ""), parameters
+
+    def iter_order_rows(self, start=None, end=None, customer=None):
+        """Yields the orders between start and end (epoch seconds) of a customer as parsed order rows, each filter being optional."""
+        where, parameters = self.order_filter(start, end, customer)
+        with self.lock:
+            rows = self.connection.execute(f"SELECT customer_id, products, quantities, total_cost, earned_rewards, timestamp FROM orders{where} ORDER BY id",
+                                           parameters).fetchall()
+        for customer_id, products, quantities, total_cost, earned_rewards, timestamp in rows:
+            yield (customer_id, products.split(), [int(quantity) for quantity in quantities.split()], total_cost, earned_rewards, timestamp)
+
+    def append_order(self, records, order):
+        """Stores a completed order together with its customer's new balance in one transaction."""
+        customer = order.customer
+        # The flag is cleared before the balance is read, so a change made meanwhile is kept for the next save
+        customer.unsaved = False
+        row = self.customer_row(records._position_of(customer, records.customers, records.customer_ids), customer, customer.get_current_reward())
+        with self.lock, self.connection:
+            self.connection.execute("INSERT INTO orders (customer_id, products, quantities, total_cost, earned_rewards, timestamp) VALUES (?, ?, ?, ?, ?, ?)",
+                                    self.order_row(order))
+            self.connection.execute("INSERT OR REPLACE INTO customers VALUES (?, ?, ?, ?, ?, ?, ?)", row)
+
+    def compact(self, records):
+        """Nothing to fold in, as orders go straight into the database."""
+
+    def upsert_products(self, records, products):
+        """Inserts or replaces the rows of products and bundles."""
+        records.mark_saved(products)
+        rows = [self.product_row(records._position_of(product, records.products, records.product_ids), product) for product in products]
+        with self.lock, self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO products VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+    def update_customers(self, records, customers):
+        """Inserts or replaces the rows of customers."""
+        records.mark_saved(customers)
+        rows = [self.customer_row(records._position_of(customer, records.customers, records.customer_ids), customer, customer.get_current_reward())
+                for customer in customers]
+        with self.lock, self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO customers VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def save_changes(self, records):
+        """Upserts the customers and products changed since the last save and returns how many there were."""
+        rates_changed = records.saved_reward_rates != (BasicCustomer.reward_rate, VIPCustomer.reward_rate)
+        customers = [(position, customer) for position, customer in enumerate(records.customers) if customer.unsaved or rates_changed]
+        products = [(position, product) for position, product in enumerate(records.products) if product.unsaved]
+        records.mark_saved(customer for _, customer in customers)
+        records.mark_saved(product for _, product in products)
+        with self.lock, self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO customers VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                        [self.customer_row(position, customer, customer.get_current_reward()) for position, customer in customers])
+            self.connection.executemany("INSERT OR REPLACE INTO products VALUES (?, ?, ?, ?, ?, ?)",
+                                        [self.product_row(position, product) for position, product in products])
+        records.saved_reward_rates = (BasicCustomer.reward_rate, VIPCustomer.reward_rate)
+        return len(customers) + len(products)
+
+    def save(self, records):
+        """Upserts every changed customer and product."""
+        self.save_changes(records)
+
+    def close(self):
+        """Closes the database connection."""
+        with self.lock:
+            self.connection.close()
 
 # Operations class
 class Operations:
-    def __init__(self, customer_file, product_file, order_file):
+    def __init__(self, customer_file, product_file, order_file, stream_orders=False, journal_batch=1, journal_fsync=False, compact_every=100, compact_orders=False, snapshot_file=None, read_only=False, load_workers=0, order_range=None, reward_ledger=False, ledger_checkpoint_every=1000, database=None):
         """Initializes the Operations class and reads customer, product and orders data from files."""
-        self.records = Records()
-        self.records.read_customers(customer_file)
-        self.records.read_products(product_file)
-        self.records.read_orders(order_file)
+        self.records = Records(compact_orders)
+        # With a reward ledger, balances come from its latest checkpoint instead of replaying every order
+        self.reward_ledger = RewardLedger(customer_file + '.rewards', ledger_checkpoint_every, fsync=journal_fsync) if reward_ledger else None
+        if self.reward_ledger and RewardLedger.exists(self.reward_ledger.directory):
+            self.records.replay_rewards = False
+        # Rewards are only replayed from the orders in a date range, so such terminals must not save
+        self.read_only = read_only or order_range is not None
+        self.autosave_stop = threading.Event()
+        self.autosave_thread = None
+        # Customers, products and orders live in the text files unless an SQLite database is given
+        if database:
+            self.storage = SQLiteStorage(database, journal_fsync)
+        else:
+            self.storage = TextStorage(customer_file, product_file, order_file, snapshot_file, self.read_only, load_workers,
+                                       journal_batch, journal_fsync, compact_every)
+        self.storage.load(self.records, stream_orders, order_range)
+        if self.reward_ledger:
+            self.open_reward_ledger()
+
+    def open_reward_ledger(self):
+        """Sets the customers' balances from the reward ledger, starting or rebuilding the ledger if needed."""
+        records = self.records
+        # The orders are still loaded for listings and summaries, so this only saves replaying their rewards
+        order_count = sum(summary.get_order_count() for summary in records.customer_summaries.values())
+        balances = None if records.replay_rewards else self.reward_ledger.load(order_count)
+        if balances is not None:
+            for customer in records.customers:
+                balance = balances.get(customer.get_id())
+                if balance is not None and balance != customer.get_current_reward():
+                    customer.reward = balance
+                    customer.unsaved = True
+            return
+        if not records.replay_rewards:
+            print("Warning: the reward ledger does not match the order history. Rebuilding balances from the orders.")
+            # Replaying every order adds each customer's total earned rewards
+            for customer in records.customers:
+                customer.update_reward(records.find_customer_summary(customer).get_total_rewards())
+            records.replay_rewards = True
+        if not self.read_only:
+            self.reward_ledger.start({customer.get_id(): customer.get_current_reward() for customer in records.customers}, order_count)
+
+    def compact_journal(self):
+        """Moves journaled orders into the main order file."""
+        self.storage.compact(self.records)
 
     # Validation methods
     def validate_customer(self, customer):
@@ -422,7 +2436,8 @@ class Operations:
         """Validates that the product exists."""
         product = self.records.find_product(product_name)
         if not product:
-            raise InvalidProductError(f"The product {product_name} is not valid. Please enter a valid product name or ID.")
+            raise InvalidProductError(f"The product {product_name} is not valid. Please enter a valid product name or ID."
+                                      + self.did_you_mean(self.records.search_products(product_name, 3)))
         return product
     
     def validate_quantity(self, quantity):
@@ -508,24 +2523,13 @@ class Operations:
                     break
 
         if products:
-            if not customer:
-                # Create a new basic customer if not found
-                customer = BasicCustomer(f"B{self.records.highest_id_number() + 1}", customer_name)
-                self.records.customers.append(customer)
-            else:
+            if customer:
                 if isinstance(customer, VIPCustomer):
                     print(f"\nWelcome Our VIP Customer {customer.get_name()}")
                 else:
                     print(f"\nWelcome Our Basic Customer {customer.get_name()}")
 
-            # Create an order object
-            order = Order(customer, products, quantities)
-
-            # Calculate order details
-            original_cost, discount, final_cost, reward_points = order.compute_cost()
-
-            # Apply reward points deduction if applicable
-            final_cost = order.apply_reward_points(final_cost)
+            customer, original_cost, discount, final_cost, reward_points = self.price_order(customer, customer_name, products, quantities)
 
             # Print receipt
             print("\n"+"-" * 40)
@@ -550,12 +2554,94 @@ class Operations:
             print(f"Total cost:\t {final_cost:.2f} (AUD)".expandtabs(20))
             print(f"Earned reward:\t {reward_points}".expandtabs(20))
 
-            # Update customer reward points
-            customer.update_reward(reward_points)
+            self.record_order(customer, products, quantities, final_cost, reward_points)
 
-            # Store order history
-            order_history = OrderHistory(customer, products, quantities, final_cost, reward_points, datetime.datetime.now())
-            self.records.order_history.append(order_history)
+    def price_order(self, customer, customer_name, products, quantities):
+        """Creates the customer if needed and returns them with the order's costs after reward deduction."""
+        if not customer:
+            # Create a new basic customer if not found
+            customer = self.records.create_customer(customer_name)
+
+        # Create an order object
+        order = Order(customer, products, quantities)
+
+        # Calculate order details
+        original_cost, discount, final_cost, reward_points = order.compute_cost()
+
+        # Apply reward points deduction if applicable
+        with customer.lock:
+            balance = customer.get_current_reward()
+            final_cost = order.apply_reward_points(final_cost)
+            if self.reward_ledger and customer.get_current_reward() != balance:
+                self.reward_ledger.record(customer.get_id(), 'redeem', customer.get_current_reward() - balance, customer.get_current_reward())
+        return customer, original_cost, discount, final_cost, reward_points
+
+    def record_order(self, customer, products, quantities, final_cost, reward_points):
+        """Updates the customer's rewards and stores the completed order in the records and the storage backend."""
+        # Update customer reward points
+        with customer.lock:
+            customer.update_reward(reward_points)
+            if self.reward_ledger:
+                self.reward_ledger.record(customer.get_id(), 'earn', reward_points, customer.get_current_reward())
+
+        # Store order history
+        order_history = OrderHistory(customer, products, quantities, final_cost, reward_points, datetime.datetime.now())
+        self.records.add_order(order_history)
+        if not self.read_only:
+            self.storage.append_order(self.records, order_history)
+        return order_history
+
+    def batch_purchase(self, line):
+        """Validates and completes one purchase line of the form: customer; products; quantities[; prescription y/n]."""
+        fields = [field.strip() for field in line.split(';')]
+        if len(fields) not in (3, 4):
+            raise InvalidQuantityError("The line must have the form: customer; products; quantities[; prescription].")
+        customer_name = fields[0]
+        customer = self.validate_customer(customer_name)
+        products = [self.validate_product(name.strip()) for name in fields[1].split(',')]
+        quantities = [self.validate_quantity(qty.strip()) for qty in fields[2].split(',')]
+        if len(products) != len(quantities):
+            raise InvalidQuantityError("The number of products and quantities must match.")
+
+        if any(product.requires_prescription() == 'y' for product in products):
+            if len(fields) != 4:
+                raise InvalidPrescriptionError("The order contains products that require a doctor's prescription, but no prescription answer was given.")
+            prescription_answer = fields[3].lower()
+            self.validate_prescription(prescription_answer)
+            if prescription_answer == 'n':
+                # Drop the products that cannot be sold without a prescription
+                kept = [(product, quantity) for product, quantity in zip(products, quantities) if product.requires_prescription() != 'y']
+                if not kept:
+                    raise InvalidPrescriptionError("None of the products can be purchased without a doctor's prescription.")
+                products, quantities = [list(column) for column in zip(*kept)]
+
+        if not customer:
+            customer = self.records.create_customer(customer_name)
+        # Reward redemption and earning happen as one step per customer
+        with customer.lock:
+            customer, _, _, final_cost, reward_points = self.price_order(customer, customer_name, products, quantities)
+            return self.record_order(customer, products, quantities, final_cost, reward_points)
+
+    def run_batch(self, lines, error_file):
+        """Completes purchases from an iterable of lines, writing rejected lines to the error file."""
+        accepted = 0
+        rejected = 0
+        start = time.perf_counter()
+        with open(error_file, 'w') as errors:
+            for line_number, line in enumerate(lines, 1):
+                if not line.strip() or line.lstrip().startswith('#'):
+                    continue
+                try:
+                    self.batch_purchase(line)
+                    accepted += 1
+                except (InvalidNameError, InvalidProductError, InvalidQuantityError, InvalidPrescriptionError) as e:
+                    errors.write(f"{line_number}: {line.strip()}  # {e}\n")
+                    rejected += 1
+        elapsed = time.perf_counter() - start
+        print(f"Batch complete: {accepted} orders accepted, {rejected} rejected in {elapsed:.2f}s "
+              f"({(accepted + rejected) / elapsed if elapsed else 0:.0f} lines/s).")
+        if rejected:
+            print(f"Rejected lines were written to {error_file}.")
 
     def display_customers(self):
         """Prints a formatted list of all customers with their details."""
@@ -580,9 +2666,78 @@ class Operations:
                 print(e)
                 print("Please re-enter the product details correctly.")
         
+        products = []
         for detail in product_details:
                     name, price, prescription = detail.split()
-                    self.records.add_or_update_product(name, float(price), prescription)
+                    products.append(self.records.add_or_update_product(name, float(price), prescription))
+        self.storage.upsert_products(self.records, products)
+
+    def import_prices(self, lines, error_file, batch_size=1000):
+        """Adds or updates products from price list lines (name price prescription), writing rejected lines to the error file."""
+        added = []
+        updated = []
+        rejected = 0
+        read = 0
+        batch = []
+        start = time.perf_counter()
+
+        def apply(batch):
+            batch_added, batch_updated = self.records.upsert_products(batch)
+            added.extend(batch_added)
+            updated.extend(batch_updated)
+            batch.clear()
+
+        with open(error_file, 'w') as errors:
+            for line_number, line in enumerate(lines, 1):
+                if not line.strip() or line.lstrip().startswith('#'):
+                    continue
+                read += 1
+                try:
+                    fields = line.replace(',', ' ').split()
+                    if len(fields) != 3:
+                        raise InvalidProductError("Expected a product name, price and prescription (y or n).")
+                    name, price, prescription = fields
+                    if isinstance(self.records.find_product(name), Bundle):
+                        raise InvalidProductError(f"{name} is a bundle, priced from its components.")
+                    price = self.validate_price(price)
+                    self.validate_prescription(prescription)
+                    batch.append((name, price, prescription))
+                except (InvalidProductError, InvalidPriceError, InvalidPrescriptionError) as e:
+                    errors.write(f"{line_number}: {line.strip()}  # {e}\n")
+                    rejected += 1
+                if len(batch) >= batch_size:
+                    apply(batch)
+            apply(batch)
+        recomputed = self.records.finish_product_updates(updated)
+        self.storage.upsert_products(self.records, added + updated)
+        elapsed = time.perf_counter() - start
+        print(f"Price import complete: {len(added)} products added, {len(updated)} updated, {rejected} rejected, "
+              f"{recomputed} bundles recomputed in {elapsed:.2f}s ({read / elapsed if elapsed else 0:.0f} rows/s).")
+        if rejected:
+            print(f"Rejected rows were written to {error_file}.")
+
+    def reprice_orders(self, lines=()):
+        """Prices the whole order history again under price list lines (name or ID, price) and prints how revenue would change."""
+        prices = {}
+        for line_number, line in enumerate(lines, 1):
+            if not line.strip() or line.lstrip().startswith('#'):
+                continue
+            try:
+                fields = line.replace(',', ' ').split()
+                if len(fields) != 2:
+                    raise InvalidProductError("Expected a product name or ID and a price.")
+                product = self.validate_product(fields[0])
+                prices[product.get_id()] = self.validate_price(fields[1])
+            except (InvalidProductError, InvalidPriceError) as e:
+                print(f"Error: Line {line_number} of the price list was skipped: {e}")
+        start = time.perf_counter()
+        original_costs, discounts, final_costs, reward_points = BatchPricing(prices).price_orders(self.records.iter_order_history(), apply_rewards=False)
+        elapsed = time.perf_counter() - start
+        recorded = sum(summary.get_total_spend() for summary in self.records.customer_summaries.values())
+        print(f"Repriced {len(final_costs)} orders in {elapsed:.2f}s with {len(prices)} price changes.")
+        print(f"Recorded revenue: {recorded:.2f}")
+        print(f"Repriced revenue: {sum(final_costs):.2f} ({sum(discounts):.2f} VIP discounts, before reward redemption)")
+        print(f"Repriced reward points: {sum(reward_points)}")
 
     def adjust_basic_customer_reward_rate(self):
         """Adjusts the reward rate for all Basic customers."""
@@ -591,6 +2746,7 @@ class Operations:
                 new_rate = input("Enter the new reward rate for all Basic customers:\n")
                 new_rate = self.validate_positive_number(new_rate)
                 BasicCustomer.set_reward_rate(new_rate)
+                self.storage.update_customers(self.records, self.records.customers)
                 print(f"\nReward rate for all Basic customers has been updated to {new_rate * 100:.0f}%.")
                 break
             except InvalidRateError as e:
@@ -601,8 +2757,12 @@ class Operations:
         while True:
                 customer_identifier = input("Enter the name or ID of the VIP customer:\n")
                 vip_customer = self.records.find_customer(customer_identifier)
+                if vip_customer and len(self.records.find_customers_by_name(customer_identifier)) > 1:
+                    print(f"There are several customers named {customer_identifier}. Please enter the customer ID instead.")
+                    continue
                 if not isinstance(vip_customer, VIPCustomer):
-                    print("Invalid customer. Please enter a valid VIP customer name or ID.")
+                    vip_customers = [customer for customer in self.records.search_customers(customer_identifier, 10) if isinstance(customer, VIPCustomer)]
+                    print("Invalid customer. Please enter a valid VIP customer name or ID." + self.did_you_mean(vip_customers[:3]))
                     continue
                 break
           
@@ -614,6 +2774,7 @@ class Operations:
             except InvalidRateError as e:
                 print(e)
         vip_customer.set_discount_rate(new_rate)
+        self.storage.update_customers(self.records, [vip_customer])
 
     def display_all_orders(self):
         """Prints a formatted list of all orders with their details."""
@@ -625,7 +2786,7 @@ class Operations:
                 customer_identifier = input("Enter the name or ID of the customer:\n")
                 customer = self.records.find_customer(customer_identifier)
                 if not customer:
-                    print("Invalid customer. Please enter a valid customer name or ID.")
+                    print("Invalid customer. Please enter a valid customer name or ID." + self.did_you_mean(self.records.search_customers(customer_identifier, 3)))
                     continue
                 break
        
@@ -640,15 +2801,133 @@ class Operations:
             products_info = ", ".join(f"{quantity} x {product.get_name()}" for product, quantity in zip(order.products, order.quantities))
             print(f"Order {i:<4}{products_info:<30}{order.total_cost:<15.2f}{order.earned_rewards:<15}") 
 
+        summary = self.records.find_customer_summary(customer)
+        print(f"{'Total':<10}{f'{summary.get_order_count()} orders':<30}{summary.get_total_spend():<15.2f}{summary.get_total_rewards():<15}")
+
+    def display_reward_history(self, customer):
+        """Prints the reward ledger events of a customer."""
+        print(f"\nReward history of {customer.get_name()} ({customer.get_id()}):")
+        print("Event\t Type\t Points\t Balance\t Date Time".expandtabs(10))
+        for sequence, kind, points, balance, date_time in self.reward_ledger.history(customer.get_id()):
+            print(f"{sequence}\t {kind}\t {points}\t {balance}\t {date_time}".expandtabs(10))
+
+    def display_top_sales(self):
+        """Prints the best selling products and the customers who spent the most."""
+        while True:
+            try:
+                count = self.validate_quantity(input("Enter how many products and customers to show:\n"))
+                break
+            except InvalidQuantityError as e:
+                print(e)
+        self.records.list_top_sales(count)
+
+    def display_daily_totals(self):
+        """Prints the revenue and number of orders of each day."""
+        self.records.list_daily_totals()
+
+    def did_you_mean(self, items):
+        """Returns a hint naming the closest matching customers or products, or an empty string if there are none."""
+        if not items:
+            return ""
+        return " Did you mean " + " or ".join(f"{item.get_name()} ({item.get_id()})" for item in items) + "?"
+
+    def search_names(self):
+        """Lists the customers and products whose ID or name best match a search, allowing typos."""
+        text = input("Enter part of a name or ID to search for:\n").strip()
+        customers = self.records.search_customers(text)
+        products = self.records.search_products(text)
+        print(f"\nMatching customers ({len(customers)}):")
+        print("Customer ID\t Name\t Reward Rate\t Discount Rate\t Reward".expandtabs(8))
+        for customer in customers:
+            customer.display_info()
+        print(f"\nMatching products ({len(products)}):")
+        print("Product ID\t Product Name\t Price\t Dr Prescription\t Bundle".expandtabs(7))
+        for product in products:
+            product.display_info()
+
+    def search_orders(self):
+        """Lists or exports the orders matching a customer, product and date range."""
+        filters = {}
+        while True:
+            customer_identifier = input("Enter the name or ID of the customer (leave empty for all customers):\n").strip()
+            if not customer_identifier:
+                break
+            filters['customer'] = self.records.find_customer(customer_identifier)
+            if filters['customer']:
+                break
+            print("Invalid customer. Please enter a valid customer name or ID." + self.did_you_mean(self.records.search_customers(customer_identifier, 3)))
+        while True:
+            try:
+                product_name = input("Enter the product name or ID (leave empty for all products):\n").strip()
+                if product_name:
+                    filters['product'] = self.validate_product(product_name)
+                break
+            except InvalidProductError as e:
+                print(e)
+        for key, prompt, end_of_day in (('start', "Enter the first date (dd/mm/yyyy, leave empty for no limit):\n", False),
+                                        ('end', "Enter the last date (dd/mm/yyyy, leave empty for no limit):\n", True)):
+            while True:
+                text = input(prompt).strip()
+                if not text:
+                    break
+                try:
+                    filters[key] = parse_date_bound(text, end_of_day)
+                    break
+                except ValueError:
+                    print("The date is not valid. Please enter a date as dd/mm/yyyy.")
+        while True:
+            try:
+                page_size = input("Enter the number of orders per page (leave empty to show all):\n").strip()
+                page_size = self.validate_quantity(page_size) if page_size else None
+                break
+            except InvalidQuantityError as e:
+                print(e)
+        output_file = input("Enter a .csv or .jsonl file to export to (leave empty to display):\n").strip()
+
+        if output_file:
+            with open(output_file, 'w', newline='') as file:
+                write_records(self.records.iter_order_records(**filters), file, 'csv' if output_file.endswith('.csv') else 'jsonl')
+            print(f"Orders exported to {output_file}.")
+        else:
+            self.records.list_orders(page_size, **filters)
+
     def save_data(self):
         """Saves the data to the files"""
-        customer_file, product_file, order_file = command_line_args()
-        self.records.save_customers(customer_file)
-        self.records.save_products(product_file)
-        if os.path.isfile(order_file):
-            self.records.save_orders(order_file)
+        self.save_files()
         sys.exit()
 
+    def save_files(self):
+        """Writes customers and products and folds journaled orders into the order file"""
+        if self.read_only:
+            return
+        # A background save still running would write the same temporary files
+        self.stop_autosave()
+        # Unchanged customers and products are left alone
+        self.storage.save(self.records)
+        if self.reward_ledger:
+            self.reward_ledger.close()
+
+    def save_changes(self):
+        """Writes changed customers and products to their changes files and flushes journaled orders"""
+        if self.read_only:
+            return 0
+        return self.storage.save_changes(self.records)
+
+    def start_autosave(self, interval):
+        """Saves changes every interval seconds from a background thread until stop_autosave is called"""
+        def autosave():
+            while not self.autosave_stop.wait(interval):
+                self.save_changes()
+        self.autosave_thread = threading.Thread(target=autosave, daemon=True)
+        self.autosave_thread.start()
+
+    def stop_autosave(self):
+        """Stops the background saves started by start_autosave, waiting for a save in progress to finish"""
+        self.autosave_stop.set()
+        if self.autosave_thread and self.autosave_thread is not threading.current_thread():
+            self.autosave_thread.join()
+        self.autosave_thread = None
+
     def display_menu(self):
         """Displays the program menu with available options."""
         print("\n"+"#" * 60)
@@ -661,6 +2940,10 @@ class Operations:
         print("6: Adjust the discount rate of a VIP customer")
         print("7: Display all orders")
         print("8: Display a customer order history")
+        print("9: Display top products and customers")
+        print("10: Display daily sales totals")
+        print("11: Search, page through or export orders")
+        print("12: Search customers and products by name")
         print("0: Exit the program")   
         print("#" * 60)
 
@@ -674,7 +2957,9 @@ class Operations:
             self.display_menu()
 
             choice = input("Choose one option: ")
-            if choice == '1':
+            if self.read_only and choice in ('1', '4', '5', '6'):
+                print("This terminal is read-only. Please choose a display option.")
+            elif choice == '1':
                 self.make_purchase()
             elif choice == '2':
                 self.display_customers()
@@ -690,6 +2975,14 @@ class Operations:
                 self.display_all_orders()
             elif choice == '8':
                 self.display_customer_order_history()
+            elif choice == '9':
+                self.display_top_sales()
+            elif choice == '10':
+                self.display_daily_totals()
+            elif choice == '11':
+                self.search_orders()
+            elif choice == '12':
+                self.search_names()
             elif choice == '0':
                 print("Exiting program...") # Exit message
                 self.save_data() # Save data before terminate
@@ -697,15 +2990,349 @@ class Operations:
                 # Display error if enter incorrect input
                 print("Invalid Choice. Please choose correct option.")
 
+# PharmacyServer class, one request line (COMMAND and arguments) in, an OK or ERR <message> line, output lines and a '.' line out
+class PharmacyServer:
+    def __init__(self, operations):
+        """Initializes a line protocol server sharing one set of records between all clients."""
+        self.operations = operations
+        self.records = operations.records
+        self.commands = {
+            'PURCHASE': self.purchase,
+            'CUSTOMERS': self.list_customers,
+            'PRODUCTS': self.list_products,
+            'ORDERS': self.list_orders,
+            'HISTORY': self.customer_history,
+            'PRODUCT': self.add_update_products,
+            'BASICRATE': self.basic_reward_rate,
+            'VIPRATE': self.vip_discount_rate,
+        }
+        self.mutating_commands = ('PURCHASE', 'PRODUCT', 'BASICRATE', 'VIPRATE')
+
+    def purchase(self, arguments):
+        """PURCHASE customer; products; quantities[; prescription]"""
+        order = self.operations.batch_purchase(arguments)
+        return [f"{order.customer.get_id()}, {order.get_total_cost():.2f}, {order.get_earned_rewards()}"]
+
+    def list_customers(self, arguments):
+        """CUSTOMERS"""
+        return capture_output(self.records.list_customers)
+
+    def list_products(self, arguments):
+        """PRODUCTS"""
+        return capture_output(self.records.list_products)
+
+    def list_orders(self, arguments):
+        """ORDERS"""
+        return capture_output(self.records.list_orders)
+
+    def customer_history(self, arguments):
+        """HISTORY customer"""
+        customer = self.records.find_customer(arguments.strip())
+        if not customer:
+            raise InvalidNameError("Invalid customer. Please enter a valid customer name or ID.")
+        return [self.records.format_order(order).rstrip('\n') for order in self.records.find_orders(customer)]
+
+    def add_update_products(self, arguments):
+        """PRODUCT name price prescription[, name price prescription ...]"""
+        product_details = []
+        for detail in arguments.split(','):
+            try:
+                name, price, prescription = detail.split()
+            except ValueError:
+                raise InvalidPriceError("The product details must have the format: product price prescription.")
+            self.operations.validate_prescription(prescription)
+            product_details.append((name, self.operations.validate_price(price), prescription))
+        products = [self.records.add_or_update_product(name, price, prescription) for name, price, prescription in product_details]
+        self.operations.storage.upsert_products(self.records, products)
+        return []
+
+    def basic_reward_rate(self, arguments):
+        """BASICRATE rate"""
+        BasicCustomer.set_reward_rate(self.operations.validate_positive_number(arguments.strip()))
+        self.operations.storage.update_customers(self.records, self.records.customers)
+        return []
+
+    def vip_discount_rate(self, arguments):
+        """VIPRATE customer; rate"""
+        customer_field, _, rate = arguments.partition(';')
+        vip_customer = self.records.find_customer(customer_field.strip())
+        if not isinstance(vip_customer, VIPCustomer):
+            raise InvalidNameError("Invalid customer. Please enter a valid VIP customer name or ID.")
+        vip_customer.set_discount_rate(self.operations.validate_positive_number(rate.strip()))
+        self.operations.storage.update_customers(self.records, [vip_customer])
+        return []
+
+    async def dispatch(self, line):
+        """Runs one request line and returns the response lines."""
+        command, _, arguments = line.strip().partition(' ')
+        handler = self.commands.get(command.upper())
+        if handler is None:
+            return [f"ERR Unknown command {command}. Commands: {', '.join(self.commands)}"]
+        if self.operations.read_only and command.upper() in self.mutating_commands:
+            return ["ERR This terminal is read-only."]
+        try:
+            # A slow listing must not hold up the other clients on the event loop
+            return ["OK"] + await asyncio.to_thread(handler, arguments)
+        except (InvalidNameError, InvalidProductError, InvalidQuantityError, InvalidPrescriptionError, InvalidPriceError, InvalidRateError) as e:
+            return [f"ERR {e}"]
+
+    async def handle_client(self, reader, writer):
+        """Serves the requests of one connected client until it disconnects or sends QUIT."""
+        try:
+            while True:
+                line = await reader.readline()
+                if not line or line.strip().upper() == b'QUIT':
+                    break
+                if not line.strip():
+                    continue
+                response = await self.dispatch(line.decode())
+                # Lines starting with '.' are doubled so the terminator stays unambiguous
+                writer.write(''.join(f"{'.' if text.startswith('.') else ''}{text}\n" for text in response).encode() + b'.\n')
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, address):
+        """Listens on host:port or unix:/path until cancelled, then saves the data."""
+        if address.startswith('unix:'):
+            server = await asyncio.start_unix_server(self.handle_client, address[5:])
+        else:
+            host, port = parse_address(address)
+            server = await asyncio.start_server(self.handle_client, host, port)
+        print(f"Serving the pharmacy on {address}. Press Ctrl+C to stop.")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.operations.save_files()
+
+# Instrumentation class, call counts, latency histograms and allocations of the hot paths
+class Instrumentation:
+    # Upper bounds of the latency histogram buckets, in seconds
+    BUCKETS = (1e-5, 1e-4, 1e-3, 1e-2, 1e-1, 1.0)
+    BUCKET_LABELS = ('<10us', '<100us', '<1ms', '<10ms', '<100ms', '<1s', '>=1s')
+    TARGETS = (
+        ('Operations', ('make_purchase', 'display_customers', 'display_products', 'add_update_products',
+                        'adjust_basic_customer_reward_rate', 'adjust_vip_customer_discount_rate', 'display_all_orders',
+                        'display_customer_order_history', 'display_top_sales', 'display_daily_totals', 'search_orders', 'search_names',
+                        'save_files', 'compact_journal', 'import_prices', 'reprice_orders', 'open_reward_ledger')),
+        ('Records', ('find_customer', 'find_product', 'find_customers_by_name', 'find_products_by_name', 'find_orders',
+                     'find_customer_summary', 'search_customers', 'search_products', 'read_customers', 'read_products', 'read_orders',
+                     'read_orders_archive', 'read_parallel', 'read_snapshot', 'save_customers', 'save_products',
+                     'save_orders', 'save_snapshot')),
+        ('Order', ('compute_cost',)),
+        ('TextStorage', ('load', 'append_order', 'upsert_products', 'update_customers', 'save', 'save_changes')),
+        ('SQLiteStorage', ('load', 'write_all', 'iter_order_rows', 'append_order', 'upsert_products', 'update_customers', 'save_changes')),
+    )
+
+    def __init__(self, profile_file=None):
+        self.stats = {} # name -> [calls, seconds, allocated blocks, histogram]
+        self.lock = threading.Lock()
+        self.profile_file = profile_file
+        self.profiler = None
+
+    def wrap(self, name, function):
+        """Returns function wrapped to record its latency and the memory blocks it leaves allocated"""
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            blocks = sys.getallocatedblocks()
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.record(name, time.perf_counter() - start, sys.getallocatedblocks() - blocks)
+        return wrapper
+
+    def record(self, name, seconds, blocks):
+        """Adds one call to the statistics of name"""
+        with self.lock:
+            stats = self.stats.get(name)
+            if stats is None:
+                stats = self.stats[name] = [0, 0.0, 0, [0] * len(self.BUCKET_LABELS)]
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] += blocks
+            stats[3][bisect.bisect_left(self.BUCKETS, seconds)] += 1
+
+    def install(self):
+        """Wraps the instrumented methods, starts the profiler if asked and reports on exit"""
+        for class_name, names in self.TARGETS:
+            cls = globals()[class_name]
+            for name in names:
+                setattr(cls, name, self.wrap(f"{class_name}.{name}", getattr(cls, name)))
+        if self.profile_file:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        atexit.register(self.report)
+
+    def report(self, file=None):
+        """Prints the statistics of every called method and writes the profile if one was asked for"""
+        file = file or sys.stderr
+        if self.profiler:
+            self.profiler.disable()
+            self.profiler.dump_stats(self.profile_file)
+            print(f"Profile written to {self.profile_file}.", file=file)
+        print("\nInstrumentation summary:", file=file)
+        print(f"{'Call':<42} {'Calls':>8} {'Total s':>9} {'Mean ms':>9} {'Blocks':>9}  " + ' '.join(f"{label:>6}" for label in self.BUCKET_LABELS), file=file)
+        with self.lock:
+            for name, (calls, seconds, blocks, histogram) in sorted(self.stats.items(), key=lambda item: -item[1][1]):
+                print(f"{name:<42} {calls:>8} {seconds:>9.3f} {seconds / calls * 1000:>9.3f} {blocks:>9}  "
+                      + ' '.join(f"{count:>6}" for count in histogram), file=file)
+
+DEFAULT_SERVER_ADDRESS = '127.0.0.1:8765'
+
+def write_paged(lines, page_size=None, chunk_size=500, file=None):
+    """Writes lines to a file, standard output by default, in chunks, pausing after each page when a page size is given"""
+    file = file or sys.stdout
+    buffer = []
+    shown = 0
+    for line in lines:
+        buffer.append(line)
+        shown += 1
+        end_of_page = page_size and shown % page_size == 0
+        if len(buffer) >= chunk_size or end_of_page:
+            file.write('\n'.join(buffer) + '\n')
+            buffer.clear()
+        if end_of_page:
+            answer = input(f"-- {shown} lines shown. Press Enter for the next page or q to stop --\n")
+            if answer.strip().lower() == 'q':
+                return
+    if buffer:
+        file.write('\n'.join(buffer) + '\n')
+
+def write_records(records, file, output_format):
+    """Writes dictionaries to a file as CSV with a header row, or as one JSON object per line"""
+    records = iter(records)
+    first = next(records, None)
+    if first is None:
+        return
+    if output_format == 'csv':
+        writer = csv.DictWriter(file, fieldnames=list(first))
+        writer.writeheader()
+        writer.writerow(first)
+        writer.writerows(records)
+    else:
+        file.write(json.dumps(first) + '\n')
+        file.writelines(json.dumps(record) + '\n' for record in records)
+
+def parse_date_bound(text, end_of_day=False):
+    """Parses a dd/mm/YYYY or dd/mm/YYYY HH:MM:SS date, taking the start or end of the day for a bare date"""
+    text = text.strip()
+    if len(text) <= 10:
+        text += " 23:59:59" if end_of_day else " 00:00:00"
+    return to_epoch(datetime.datetime.strptime(text, "%d/%m/%Y %H:%M:%S"))
+
+def capture_output(function):
+    """Runs a function that prints to its file argument and returns its output lines."""
+    # Server handlers run in worker threads, so standard output itself is never redirected
+    output = io.StringIO()
+    function(file=output)
+    return output.getvalue().splitlines()
+
+def parse_address(address):
+    """Splits host:port into a host and a port number, defaulting to the loopback interface"""
+    host, _, port = address.rpartition(':')
+    return host or '127.0.0.1', int(port)
+
+async def open_client(address):
+    """Connects to a pharmacy server at host:port or unix:/path."""
+    if address.startswith('unix:'):
+        return await asyncio.open_unix_connection(address[5:])
+    return await asyncio.open_connection(*parse_address(address))
+
+async def send_requests(address, lines):
+    """Sends request lines to a pharmacy server and returns the response lines of each."""
+    reader, writer = await open_client(address)
+    responses = []
+    try:
+        for line in lines:
+            if not line.strip():
+                continue
+            writer.write(line.rstrip('\n').encode() + b'\n')
+            await writer.drain()
+            response = []
+            while True:
+                text = (await reader.readline()).decode().rstrip('\n')
+                if text == '.':
+                    break
+                response.append(text[1:] if text.startswith('..') else text)
+            responses.append(response)
+        writer.write(b'QUIT\n')
+        await writer.drain()
+    finally:
+        writer.close()
+    return responses
+
+def snapshot_is_current(snapshot_file, filenames):
+    """Returns whether the snapshot exists and is newer than every existing text file"""
+    if not snapshot_file or not os.path.isfile(snapshot_file):
+        return False
+    snapshot_time = os.path.getmtime(snapshot_file)
+    return all(snapshot_time >= os.path.getmtime(filename) for filename in filenames if os.path.isfile(filename))
+
+def default_snapshot_file(customer_file):
+    """Returns the snapshot file kept next to the customer file"""
+    return os.path.join(os.path.dirname(customer_file), "pharmacy.snapshot")
+
+def parallel_workers(option):
+    """Returns the number of loader processes requested by --parallel-load[=N]"""
+    if not option:
+        return 0
+    return (os.cpu_count() or 1) if option is True else int(option)
+
+def command_line_options():
+    """Splits command line arguments into file arguments and --option flags"""
+    file_args = []
+    options = {}
+    for arg in sys.argv[1:]:
+        if arg.startswith('--'):
+            name, _, value = arg[2:].partition('=')
+            options[name] = value if value else True
+        else:
+            file_args.append(arg)
+    return file_args, options
+
+def show_usage():
+    """Prints how to run the program and exits"""
+    print("Usage: python pharmacy.py <customer_file> <product_file> [order_file] [--stream-orders] [--journal-batch=N] [--journal-fsync] [--compact-every=N] [--compact-orders] [--snapshot=FILE] [--export-snapshot | --import-snapshot] [--read-only] [--batch=FILE|-] [--batch-errors=FILE] [--parallel-load[=N]] [--serve=HOST:PORT|unix:PATH] [--report[=N]] [--instrument] [--profile[=FILE]] [--save-every=SECONDS]\n"
+          "       [--import-prices=FILE|- [--import-errors=FILE]] [--reprice-orders[=PRICE_FILE]]\n"
+          "       [--reward-ledger[=CHECKPOINT_EVERY] [--verify-rewards] [--reward-history=NAME_OR_ID]]\n"
+          "       [--database=FILE [--export-text]]\n"
+          "       [--partition-orders[=month|day]] [--compress-partitions[=gzip|lzma]] [--orders-from=DATE] [--orders-to=DATE]\n"
+          "       [--list=orders|customers|products [--format=text|csv|jsonl] [--output=FILE] [--page-size=N]\n"
+          "        [--from=DATE] [--to=DATE] [--customer=NAME_OR_ID] [--product=NAME_OR_ID]]\n"
+          "       python pharmacy.py --client=HOST:PORT|unix:PATH < requests")
+    sys.exit()
+
+def check_options(options):
+    """Shows the usage if a listing or date option has a value the program cannot use"""
+    error = None
+    if 'list' in options and options['list'] not in ('orders', 'customers', 'products'):
+        error = "--list must be orders, customers or products."
+    elif 'format' in options and options['format'] not in ('text', 'csv', 'jsonl'):
+        error = "--format must be text, csv or jsonl."
+    elif 'page-size' in options and not (isinstance(options['page-size'], str) and options['page-size'].isdigit() and int(options['page-size']) > 0):
+        error = "--page-size must be a positive whole number."
+    for name in ('from', 'to', 'orders-from', 'orders-to'):
+        if name in options and not error:
+            try:
+                parse_date_bound(options[name] if options[name] is not True else '')
+            except ValueError:
+                error = f"--{name} must be a date as dd/mm/yyyy or dd/mm/yyyy HH:MM:SS."
+    if error:
+        print(f"Error: {error}")
+        show_usage()
+
 def command_line_args():
     """Reads file from command line arguments"""
     # default files
     customer_file = "customers.txt"
     product_file = "products.txt"
     order_file = "orders.txt"
+    file_args, _ = command_line_options()
 
     # If no argument passed through command line it checks for default files
-    if len(sys.argv) == 1:
+    if len(file_args) == 0:
         if not os.path.isfile(customer_file):
             print("Error: Customer file not found in local directory.")
             sys.exit()
@@ -715,19 +3342,207 @@ def command_line_args():
             sys.exit()
 
     # Show usage if invalid number of arguments passed
-    elif len(sys.argv) < 3 or len(sys.argv) > 4:
-        print("Usage: python pharmacy.py <customer_file> <product_file> [order_file]")
-        sys.exit()
+    elif len(file_args) < 2 or len(file_args) > 3:
+        show_usage()
    
     else:
-        customer_file = sys.argv[1]
-        product_file = sys.argv[2]
-        order_file = order_file if len(sys.argv) == 3 else sys.argv[3]
+        customer_file = file_args[0]
+        product_file = file_args[1]
+        order_file = order_file if len(file_args) == 2 else file_args[2]
 
     return customer_file, product_file, order_file
 
 # Main program
 if __name__ == "__main__":
+    _, options = command_line_options()
+
+    # Loopback client: send request lines from stdin to a running server
+    if options.get('client'):
+        address = options['client'] if options['client'] is not True else DEFAULT_SERVER_ADDRESS
+        for response in asyncio.run(send_requests(address, sys.stdin)):
+            print('\n'.join(response))
+        sys.exit()
+
+    # Opt-in instrumentation, also enabled by the PHARMACY_INSTRUMENT and PHARMACY_PROFILE environment variables
+    profile_file = options.get('profile') or os.environ.get('PHARMACY_PROFILE')
+    if options.get('instrument') or os.environ.get('PHARMACY_INSTRUMENT') or profile_file:
+        Instrumentation(profile_file if profile_file is not True else 'pharmacy.prof').install()
+
     customer_file, product_file, order_file = command_line_args()
-    operations = Operations(customer_file, product_file, order_file)
-    operations.run()
\ No newline at end of file
+    check_options(options)
+    snapshot_file = options.get('snapshot') or default_snapshot_file(customer_file)
+
+    # Convert between the text files and the binary snapshot without starting the menu
+    if options.get('export-snapshot'):
+        records = Records()
+        records.read_customers(customer_file)
+        records.read_products(product_file)
+        records.read_orders(order_file)
+        if records.unresolved_products:
+            print("Error: Fix the bundles above before writing a snapshot, which cannot hold them.")
+            sys.exit()
+        records.save_snapshot(snapshot_file, loaded_rewards=True)
+        print(f"Snapshot written to {snapshot_file}.")
+        sys.exit()
+    if options.get('import-snapshot'):
+        records = Records()
+        records.read_snapshot(snapshot_file)
+        records.save_customers(customer_file, loaded_rewards=True)
+        records.save_products(product_file)
+        records.save_orders(order_file)
+        print(f"Text files written from {snapshot_file}.")
+        sys.exit()
+
+    # Use an SQLite database instead of the text files, creating it from them the first time
+    database = options.get('database') if options.get('database') is not True else 'pharmacy.db'
+    if database and not os.path.isfile(database):
+        records = Records()
+        records.read_customers(customer_file)
+        records.read_products(product_file)
+        records.read_orders(order_file)
+        if records.unresolved_products:
+            print("Error: Fix the bundles above before creating a database, which cannot hold them.")
+            sys.exit()
+        storage = SQLiteStorage(database)
+        storage.write_all(records, loaded_rewards=True)
+        storage.close()
+        print(f"Database {database} created from the text files.")
+    if database and options.get('export-text'):
+        records = Records()
+        SQLiteStorage(database).load(records)
+        records.save_customers(customer_file, loaded_rewards=True)
+        records.save_products(product_file)
+        records.save_orders(order_file)
+        print(f"Text files written from {database}.")
+        sys.exit()
+
+    # Move the orders of the order file into date partitions, or compress the older partitions
+    if options.get('partition-orders') or options.get('compress-partitions'):
+        OrderPartitions.recover(order_file)
+        partitions = OrderPartitions(order_file)
+        if options.get('partition-orders'):
+            granularity = 'month' if options['partition-orders'] is True else options['partition-orders']
+            count = partitions.add_orders(order_file, granularity)
+            print(f"{count} orders moved into {partitions.granularity} partitions in {partitions.directory}.")
+        if options.get('compress-partitions'):
+            method = 'gzip' if options['compress-partitions'] is True else options['compress-partitions']
+            print(f"{partitions.compress(method)} partitions compressed with {method}.")
+        sys.exit()
+
+    operations = Operations(customer_file, product_file, order_file,
+                            stream_orders=bool(options.get('stream-orders')),
+                            journal_batch=int(options.get('journal-batch', 1000 if options.get('batch') else 1)),
+                            journal_fsync=bool(options.get('journal-fsync')),
+                            compact_every=int(options.get('compact-every', 100)),
+                            compact_orders=bool(options.get('compact-orders')),
+                            snapshot_file=snapshot_file,
+                            read_only=bool(options.get('read-only')),
+                            load_workers=parallel_workers(options.get('parallel-load')),
+                            order_range=(parse_date_bound(options['orders-from']) if options.get('orders-from') else None,
+                                         parse_date_bound(options['orders-to'], end_of_day=True) if options.get('orders-to') else None)
+                            if options.get('orders-from') or options.get('orders-to') else None,
+                            reward_ledger=bool(options.get('reward-ledger')),
+                            ledger_checkpoint_every=1000 if options.get('reward-ledger') in (None, True) else int(options['reward-ledger']),
+                            database=database)
+
+    # Audit the reward ledger and exit
+    if options.get('verify-rewards') or options.get('reward-history'):
+        if not operations.reward_ledger:
+            print("Error: --verify-rewards and --reward-history need --reward-ledger.")
+            sys.exit()
+        if options.get('reward-history'):
+            customer = operations.records.find_customer(options['reward-history'])
+            if not customer:
+                print(f"Error: Customer {options['reward-history']} not found.")
+                sys.exit()
+            operations.display_reward_history(customer)
+        if options.get('verify-rewards'):
+            problems = operations.reward_ledger.verify()
+            print('\n'.join(problems) if problems else "The reward ledger is consistent from its start and from every checkpoint.")
+        sys.exit()
+
+    # Save changed customers and products in the background, not only on exit
+    if options.get('save-every'):
+        operations.start_autosave(float(options['save-every']))
+
+    # Price the order history again under a new price list, or the current prices, and exit
+    if options.get('reprice-orders'):
+        if options['reprice-orders'] is True:
+            operations.reprice_orders()
+        else:
+            with open(options['reprice-orders'], 'r') as file:
+                operations.reprice_orders(file)
+        sys.exit()
+
+    # Print the sales report and exit
+    if options.get('report'):
+        operations.records.list_top_sales(10 if options['report'] is True else int(options['report']))
+        operations.records.list_daily_totals()
+        sys.exit()
+
+    # List or export customers, products or filtered orders and exit
+    if options.get('list'):
+        records = operations.records
+        filters = {}
+        if options.get('from'):
+            filters['start'] = parse_date_bound(options['from'])
+        if options.get('to'):
+            filters['end'] = parse_date_bound(options['to'], end_of_day=True)
+        if options.get('customer'):
+            filters['customer'] = records.find_customer(options['customer'])
+            if not filters['customer']:
+                print(f"Error: Customer {options['customer']} not found.")
+                sys.exit()
+        if options.get('product'):
+            filters['product'] = records.find_product(options['product'])
+            if not filters['product']:
+                print(f"Error: Product {options['product']} not found.")
+                sys.exit()
+        output_format = options.get('format', 'text')
+        page_size = int(options['page-size']) if options.get('page-size') else None
+        if output_format == 'text':
+            {'orders': lambda: records.list_orders(page_size, **filters),
+             'customers': lambda: records.list_customers(page_size),
+             'products': lambda: records.list_products(page_size)}[options['list']]()
+        else:
+            rows = {'orders': lambda: records.iter_order_records(**filters),
+                    'customers': records.iter_customer_records,
+                    'products': records.iter_product_records}[options['list']]()
+            if options.get('output'):
+                with open(options['output'], 'w', newline='') as file:
+                    write_records(rows, file, output_format)
+            else:
+                write_records(rows, sys.stdout, output_format)
+        sys.exit()
+
+    # Non-interactive purchases from a file, or stdin with --batch=-
+    if options.get('batch'):
+        batch_file = options['batch']
+        error_file = options.get('batch-errors') or ("batch_errors.txt" if batch_file in ('-', True) else batch_file + ".errors")
+        if batch_file in ('-', True):
+            operations.run_batch(sys.stdin, error_file)
+        else:
+            with open(batch_file, 'r') as file:
+                operations.run_batch(file, error_file)
+        operations.save_data()
+
+    # Add or update products from a supplier price list, or stdin with --import-prices=-
+    if options.get('import-prices'):
+        price_file = options['import-prices']
+        error_file = options.get('import-errors') or ("price_errors.txt" if price_file in ('-', True) else price_file + ".errors")
+        if price_file in ('-', True):
+            operations.import_prices(sys.stdin, error_file)
+        else:
+            with open(price_file, 'r') as file:
+                operations.import_prices(file, error_file)
+        operations.save_data()
+
+    # Serve many terminals from this process instead of the menu
+    if options.get('serve'):
+        try:
+            asyncio.run(PharmacyServer(operations).serve(options['serve'] if options['serve'] is not True else DEFAULT_SERVER_ADDRESS))
+        except KeyboardInterrupt:
+            pass
+        sys.exit()
+
+    operations.run()
@@ -0,0 +1,328 @@
+import sys
+import os
+import time
+import random
+import tempfile
+import tracemalloc
+import threading
+import json
+import resource
+import platform
+import contextlib
+import datetime
+
+from App import Records, BasicCustomer, VIPCustomer, Bundle, BatchPricing, Operations, command_line_options, to_epoch
+
+# Baseline Order, copied verbatim from before __slots__ and epoch timestamps
+class LegacyOrder:
+    def __init__(self, customer, products, quantities):
+        """Initializes a new order with a customer, products, and quantities."""
+        self.customer = customer
+        self.products = products
+        self.quantities = quantities
+    
+    def compute_cost(self):
+        """Computes and returns the original cost, discount, final cost, and reward points for the order."""
+        original_cost = sum(product.get_price() * quantity for product, quantity in zip(self.products, self.quantities))
+        discount = 0.0  # Initialize discount for non-VIP customers
+        final_cost = original_cost
+        reward_points = 0
+
+        if isinstance(self.customer, VIPCustomer):
+            discount = self.customer.get_discount(original_cost)
+            final_cost = original_cost - discount
+            reward_points = self.customer.get_reward(final_cost)
+        else:
+            reward_points = self.customer.get_reward(original_cost)
+
+        return original_cost, discount, final_cost, reward_points
+    
+    def apply_reward_points(self, final_cost):
+        """Applies reward points to reduce the final cost if the customer has more than 100 points."""
+        if self.customer.reward >= 100:
+            reward_deduction = (self.customer.reward // 100) * 10
+            final_cost -= reward_deduction
+            self.customer.reward %= 100
+            if final_cost < 0:
+                final_cost = 0
+        return final_cost
+
+# Baseline OrderHistory with a per-instance __dict__ and a formatted date string per order
+class LegacyOrderHistory(LegacyOrder):
+    def __init__(self, customer, products, quantities, total_cost, earned_rewards, date_time):
+        """Initializes a new order history with a customer, products, quantities, total cost, earned rewards and date."""
+        super().__init__(customer, products, quantities)
+        self.total_cost = total_cost
+        self.earned_rewards = earned_rewards
+        self.date_time = datetime.datetime.strftime(date_time, "%d/%m/%Y %H:%M:%S") if isinstance(date_time, datetime.datetime) else date_time
+
+    def display_info(self):
+        """Displays the order history information."""
+        products_str = ', '.join(f'{quantity} x {product.get_id()}' for product, quantity in zip(self.products,self.quantities))
+
+        dt = datetime.datetime.strptime(self.date_time, "%d/%m/%Y %H:%M:%S")
+        readable_string = dt.strftime("%a, %d/%b/%y at %H:%M")
+
+        print(f"{self.customer.get_name():<7} {products_str:<23} {self.total_cost}\t {self.earned_rewards}\t {readable_string}".expandtabs(8))
+
+    def get_customer_id(self):
+        """Returns the customer's id"""
+        return self.customer.get_id()
+    
+    def get_total_cost(self):
+        """Returns the total cost of order"""
+        return self.total_cost
+    
+    def get_earned_rewards(self):
+        """Returns the earned reward of order"""
+        return self.earned_rewards
+    
+    def get_date_time(self):
+        """Returns the date time of order"""
+        return self.date_time
+
+    def get_timestamp(self):
+        """Returns the date time of order in seconds since the epoch, which Records needs for its totals"""
+        return to_epoch(self.date_time)
+
+# Records that builds __dict__ based order history objects
+class LegacyRecords(Records):
+    def build_order_history(self, row):
+        """Builds a __dict__ based order history object from a parsed order row."""
+        customer_id_or_name, product_ids, quantities, total_cost, earned_rewards, date_time = row
+        products = [self.find_product(product_id_or_name) for product_id_or_name in product_ids]
+        return LegacyOrderHistory(self.find_customer(customer_id_or_name), products, quantities, total_cost, earned_rewards, date_time)
+
+def write_sample_files(directory, customer_count, product_count, order_count, seed=1, bundle_count=0):
+    """Writes synthetic customer, product, bundle and order files and returns their paths."""
+    rng = random.Random(seed)
+    customer_file = os.path.join(directory, "customers.txt")
+    product_file = os.path.join(directory, "products.txt")
+    order_file = os.path.join(directory, "orders.txt")
+
+    with open(customer_file, 'w') as file:
+        for i in range(1, customer_count + 1):
+            # Every fifth customer is a VIP with their own discount rate
+            if i % 5 == 0:
+                file.write(f"V{i}, customer{i}, 1.0, {rng.randint(1, 20) / 100}, {rng.randint(0, 300)}\n")
+            else:
+                file.write(f"B{i}, customer{i}, 1.0, {rng.randint(0, 300)}\n")
+
+    with open(product_file, 'w') as file:
+        for i in range(1, product_count + 1):
+            file.write(f"P{i}, product{i}, {rng.randint(100, 5000) / 100}, {'y' if i % 7 == 0 else 'n'}\n")
+        # Bundles take the IDs after the products and only contain products
+        for i in range(product_count + 1, product_count + bundle_count + 1):
+            components = ', '.join(f"P{number}" for number in rng.sample(range(1, product_count + 1), min(product_count, rng.randint(2, 4))))
+            file.write(f"B{i}, bundle{i}, {components}\n")
+
+    def item():
+        number = rng.randint(1, product_count + bundle_count)
+        return f"{'P' if number <= product_count else 'B'}{number}"
+
+    with open(order_file, 'w') as file:
+        for _ in range(order_count):
+            lines = ', '.join(f"{item()}, {rng.randint(1, 5)}" for _ in range(rng.randint(1, 4)))
+            cost = rng.randint(100, 20000) / 100
+            file.write(f"customer{rng.randint(1, customer_count)}, {lines}, {cost}, {round(cost)}, "
+                       f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/2024 {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00\n")
+
+    return customer_file, product_file, order_file
+
+def measure_order_memory(records, customer_file, product_file, order_file):
+    """Loads the files into the given records and returns the bytes held by the order history."""
+    records.read_customers(customer_file)
+    records.read_products(product_file)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    records.read_orders(order_file)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return after - before
+
+def memory_benchmark(order_count=100000, customer_count=1000, product_count=500):
+    """Compares the memory held by the order history in each storage mode."""
+    with tempfile.TemporaryDirectory() as directory:
+        files = write_sample_files(directory, customer_count, product_count, order_count)
+        results = {
+            "dict objects": measure_order_memory(LegacyRecords(), *files),
+            "slotted objects": measure_order_memory(Records(), *files),
+            "columnar store": measure_order_memory(Records(compact_orders=True), *files),
+        }
+
+    print(f"Order history memory for {order_count} orders:")
+    for mode, size in results.items():
+        print(f"{mode:<18}{size / 1024 / 1024:>10.2f} MiB{size / order_count:>10.1f} bytes/order")
+    return results
+
+def pricing_check(order_count=100000, customer_count=1000, product_count=500, bundle_count=50):
+    """Checks BatchPricing against compute_cost and apply_reward_points at the current prices and under overrides, and times both."""
+    rng = random.Random(2)
+    prices = {f"P{number}": rng.randint(100, 5000) / 100 for number in range(1, product_count + 1, 10)}
+    prices.update({f"B{number}": rng.randint(100, 5000) / 100 for number in range(product_count + 1, product_count + bundle_count + 1, 5)})
+    runs = [("current prices", {}, None, None), ("overrides", prices, 0.5, 1.5)]
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        customer_file, product_file, order_file = write_sample_files(directory, customer_count, product_count, order_count, bundle_count=bundle_count)
+        for label, prices, basic_reward_rate, vip_reward_rate in runs:
+            records = Records()
+            records.read_customers(customer_file)
+            records.read_products(product_file)
+            records.read_orders(order_file)
+            orders = records.order_history
+
+            start = time.perf_counter()
+            batch = BatchPricing(prices, basic_reward_rate, vip_reward_rate).price_orders(orders)
+            batch_time = time.perf_counter() - start
+
+            # Products first, so a bundle override is not undone by a change to one of its components
+            for product in sorted((records.find_product(product_id) for product_id in prices), key=lambda product: isinstance(product, Bundle)):
+                product.update_price(prices[product.get_id()])
+            rates = BasicCustomer.reward_rate, VIPCustomer.reward_rate
+            if basic_reward_rate is not None:
+                BasicCustomer.set_reward_rate(basic_reward_rate)
+            if vip_reward_rate is not None:
+                VIPCustomer.set_reward_rate(vip_reward_rate)
+            try:
+                start = time.perf_counter()
+                expected = []
+                for order in orders:
+                    original_cost, discount, final_cost, reward_points = order.compute_cost()
+                    final_cost = order.apply_reward_points(final_cost)
+                    order.customer.update_reward(reward_points)
+                    expected.append((original_cost, discount, final_cost, reward_points))
+                single_time = time.perf_counter() - start
+            finally:
+                BasicCustomer.set_reward_rate(rates[0])
+                VIPCustomer.set_reward_rate(rates[1])
+
+            mismatches = [i for i, row in enumerate(expected) if row != tuple(column[i] for column in batch)]
+            print(f"Priced {len(orders)} orders at {label}: batch {batch_time:.3f}s, one by one {single_time:.3f}s, {len(mismatches)} mismatches")
+            if mismatches:
+                i = mismatches[0]
+                raise AssertionError(f"Order {i} at {label}: expected {expected[i]}, batch gave {tuple(column[i] for column in batch)}")
+            results[label] = batch_time, single_time
+    return results
+
+def concurrency_check(thread_count=8, purchase_count=500, customer_count=50, product_count=20):
+    """Runs purchases from many threads at once and checks that orders and rewards are conserved."""
+    with tempfile.TemporaryDirectory() as directory:
+        files = write_sample_files(directory, customer_count, product_count, 0)
+        operations = Operations(*files, compact_every=50)
+        records = operations.records
+        starting_rewards = {customer.get_id(): customer.get_current_reward() for customer in records.customers}
+
+        # Purchases for existing customers mixed with new customers that several threads create at once
+        def worker(seed):
+            rng = random.Random(seed)
+            for _ in range(purchase_count):
+                name = f"customer{rng.randint(1, customer_count)}" if rng.random() < 0.9 else f"newcomer{chr(97 + rng.randint(0, 9))}"
+                operations.batch_purchase(f"{name}; P{rng.randint(1, product_count)}; {rng.randint(1, 3)}; y")
+
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(thread_count)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        sys.setswitchinterval(switch_interval)
+        operations.compact_journal()
+        with open(files[2]) as file:
+            journaled = sum(1 for _ in file)
+
+    expected = thread_count * purchase_count
+    ids = [customer.get_id() for customer in records.customers]
+    assert len(records.order_history) == expected, f"{len(records.order_history)} orders recorded, expected {expected}"
+    assert journaled == expected, f"{journaled} orders journaled, expected {expected}"
+    assert len(ids) == len(set(ids)), "Duplicate customer IDs were allocated"
+    assert len(records.customers) <= customer_count + 10, "A new customer was created more than once"
+    assert sum(summary.get_order_count() for summary in records.customer_summaries.values()) == expected
+
+    # Replaying each customer's orders one by one must give the same balance
+    for customer in records.customers:
+        balance = starting_rewards.get(customer.get_id(), 0)
+        for order in records.find_orders(customer):
+            if balance >= 100:
+                balance %= 100
+            balance += order.get_earned_rewards()
+        assert balance == customer.get_current_reward(), f"{customer.get_id()} has {customer.get_current_reward()} rewards, expected {balance}"
+
+    print(f"{thread_count} threads x {purchase_count} purchases: {expected / elapsed:.0f} purchases/s, orders and rewards conserved")
+    return elapsed
+
+def peak_memory():
+    """Returns the peak resident memory of this process in bytes."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def timed(results, name, count, function):
+    """Runs function, records its time, throughput and the peak memory so far under name, and returns its result."""
+    start = time.perf_counter()
+    value = function()
+    elapsed = time.perf_counter() - start
+    results[name] = {"seconds": elapsed, "operations": count, "per_second": count / elapsed if elapsed else None, "peak_memory": peak_memory()}
+    print(f"{name:<16}{elapsed:>10.3f}s{count:>12}{results[name]['per_second'] or 0:>14.0f}/s{results[name]['peak_memory'] / 1024 / 1024:>10.1f} MiB")
+    return value
+
+def benchmark_suite(order_count=100000, customer_count=None, product_count=500, bundle_count=50, sample_count=1000, output=None, seed=1):
+    """Times loading, lookups, pricing, order queries, listing and saving on synthetic data and optionally saves the results as JSON."""
+    customer_count = customer_count or max(100, order_count // 100)
+    rng = random.Random(seed)
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"Benchmarking {order_count} orders, {customer_count} customers, {product_count} products, {bundle_count} bundles")
+        print(f"{'step':<16}{'time':>11}{'operations':>12}{'throughput':>16}{'peak':>14}")
+        files = timed(results, "generate", order_count, lambda: write_sample_files(directory, customer_count, product_count, order_count, seed, bundle_count))
+        operations = timed(results, "load", order_count, lambda: Operations(*files))
+        records = operations.records
+
+        customers = [f"customer{rng.randint(1, customer_count)}" if i % 2 else f"{'V' if i % 5 == 0 else 'B'}{i}" for i in
+                     (rng.randint(1, customer_count) for _ in range(sample_count))]
+        products = [f"product{rng.randint(1, product_count)}" if i % 2 else f"P{rng.randint(1, product_count)}" for i in range(sample_count)]
+        timed(results, "find_customer", sample_count, lambda: [records.find_customer(key) for key in customers])
+        timed(results, "find_product", sample_count, lambda: [records.find_product(key) for key in products])
+
+        orders = records.order_history[:sample_count * 100]
+        timed(results, "compute_cost", len(orders), lambda: [order.compute_cost() for order in orders])
+        found = [customer for customer in (records.find_customer(key) for key in customers) if customer]
+        timed(results, "find_orders", len(found), lambda: [records.find_orders(customer) for customer in found])
+        def list_orders():
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                records.list_orders()
+        timed(results, "list_orders", order_count, list_orders)
+
+        # save_data exits the process, so time the save_files step it runs first
+        timed(results, "save_files", len(records.customers) + len(records.products), operations.save_files)
+
+    report = {
+        "date": datetime.datetime.now().isoformat(timespec='seconds'),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "scale": {"orders": order_count, "customers": customer_count, "products": product_count, "bundles": bundle_count, "samples": sample_count},
+        "results": results,
+    }
+    if output:
+        with open(output, 'w') as file:
+            json.dump(report, file, indent=2)
+        print(f"Results saved to {output}")
+    return report
+
+if __name__ == "__main__":
+    file_args, options = command_line_options()
+    order_count = int(options.get('orders', file_args[0] if file_args else 100000))
+    if options.get('generate'):
+        # Only write the data files, e.g. to run App.py against them
+        os.makedirs(options['generate'], exist_ok=True)
+        print(*write_sample_files(options['generate'], int(options.get('customers', max(100, order_count // 100))), int(options.get('products', 500)),
+                                  order_count, int(options.get('seed', 1)), int(options.get('bundles', 50))))
+    elif options.get('suite'):
+        benchmark_suite(order_count, int(options['customers']) if options.get('customers') else None, int(options.get('products', 500)),
+                        int(options.get('bundles', 50)), int(options.get('samples', 1000)), options.get('output'), int(options.get('seed', 1)))
+    else:
+        memory_benchmark(order_count)
+        pricing_check(order_count)
+        concurrency_check()